@@ -14,6 +14,14 @@ import machine
 import utime
 import ustruct
 import sys
+import math
+from array import array
+
+try:
+    import DfrobotGP8403_native as _native
+except (ImportError, SyntaxError):
+    # Port without the native and viper emitters
+    _native = None
 
 # Select DAC output voltage of 0-5V
 OUTPUT_RANGE_5V = 0
@@ -25,6 +33,303 @@ CHANNEL0 = 1
 CHANNEL1 = 2
 # Select to output from all the channels
 CHANNELALL = 3
+# Waveform shape: sine
+WAVE_SIN = 0
+# Waveform shape: triangle (sawtooth)
+WAVE_TRIANGLE = 1
+# Waveform shape: square
+WAVE_SQUARE = 2
+# Fewest and most points per period of a sine wave
+SINE_MIN_POINTS = 16
+SINE_MAX_POINTS = 512
+# Number of compiled waveforms kept in memory
+WAVEFORM_CACHE_SIZE = 8
+# Samples held by the ring of a background sample pump, a power of two
+PUMP_SIZE = 512
+
+
+def _to_word(code):
+    if code <= 0:
+        return 0
+    if code >= 4095:
+        return 4095 << 4
+    return code << 4
+
+
+def compile_waveform(shape, amp, freq, offset, duty_cycle, voltage, sample_rate):
+    """
+    Compile a waveform into register words, same shapes as the Raspberry Pi driver
+    :param shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+    :param amp: Amplitude Vp in mV
+    :param freq: Frequency in Hz
+    :param offset: DC offset in mV
+    :param duty_cycle: Duty cycle of triangle and square waves in %
+    :param voltage: Full-scale voltage of the output range in mV
+    :param sample_rate: Samples per second the bus sustains, sizes the sine table
+    :return: (array('H') of register words, frame period in us)
+    """
+    if freq <= 0:
+        raise ValueError("freq must be positive")
+    k = 4096 / voltage
+    if shape == WAVE_SIN:
+        points = SINE_MIN_POINTS
+        while points < SINE_MAX_POINTS and points * 2 * freq <= sample_rate:
+            points *= 2
+        scale = amp / voltage * 2
+        dc = offset * k
+        words = array('H', bytearray(2 * points))
+        for i in range(points):
+            code = math.floor(2047.5 + 2047.5 * math.sin(2 * math.pi * i / points) + 0.5)
+            words[i] = _to_word(int((code - 2047) * scale + dc))
+        return words, int(1000000 / (freq * points))
+    if freq > 20:
+        num = 16
+    elif freq >= 11:
+        num = 32
+    else:
+        num = 64
+    duty_cycle = min(max(duty_cycle, 0), 100)
+    max_v = int(amp * k)
+    up_num = (2 * num) * duty_cycle / 100
+    down_num = (2 * num) - up_num
+    if up_num == 0:
+        up_num = 1
+    if shape == WAVE_TRIANGLE:
+        dc = int(offset * k)
+        up_step = max(int(max_v / up_num), 1)
+        words = [_to_word(i + dc) for i in range(0, max_v - up_step - 1, up_step)]
+        if down_num > 0:
+            down_step = int(max_v / down_num)
+            words.extend(_to_word(max_v - 1 - i * down_step + dc) for i in range(int(down_num)))
+    elif shape == WAVE_SQUARE:
+        words = [_to_word(int(max_v + offset * k))] * int(up_num)
+        words.extend([_to_word(int(max_v - offset * k))] * int(down_num))
+    else:
+        raise ValueError("unknown waveform shape")
+    return array('H', words), int(1000000 / (freq * num * 2))
+
+
+def store_steps(addr, before=2, after=3, total=5, delay=1000):
+    """
+    Build the store sequence as (levels, delay_us) pairs: set the lines, then hold.
+    Levels bit 0 is SCL and bit 1 is SDA. The acknowledge slots drive SDA low, which the
+    module does itself, so the sequence can be played without reading the line.
+    :param addr: I2C address of the module
+    :param before: First half of the bit-bang cycle in us
+    :param after: Second half of the bit-bang cycle in us
+    :param total: Full bit-bang cycle in us
+    :param delay: Pause between the two store phases in us
+    :return: array('H')
+    """
+    steps = array('H')
+    state = [3]
+
+    def put(scl=None, sda=None, hold=0):
+        levels = state[0]
+        if scl is not None:
+            levels = (levels & 2) | scl
+        if sda is not None:
+            levels = (levels & 1) | (sda << 1)
+        state[0] = levels
+        steps.append(levels)
+        steps.append(hold)
+
+    def start():
+        put(1, 1, before)
+        put(sda=0, hold=after)
+        put(scl=0, hold=total)
+
+    def stop():
+        put(sda=0, hold=before)
+        put(scl=1, hold=total)
+        put(sda=1, hold=total)
+
+    def byte(data, bits=8, flag=True):
+        data &= 0xFF
+        for i in range(bits - 1, -1, -1):
+            put(sda=(data >> i) & 1, hold=before)
+            put(scl=1, hold=total)
+            put(scl=0, hold=after)
+        if flag:
+            put(sda=0, hold=before)
+            put(scl=1, hold=after + before)
+            put(scl=0, hold=after)
+        else:
+            put(sda=0)
+            put(scl=1)
+
+    head, timing_addr, cmd1, cmd2 = 0x02, 0x10, 0x03, 0x00
+    start()
+    byte(head, 3, False)
+    stop()
+    start()
+    byte(timing_addr)
+    byte(cmd1)
+    stop()
+    start()
+    byte(addr << 1)
+    for _ in range(8):
+        byte(cmd2)
+    stop()
+    put(hold=delay)
+    start()
+    byte(head, 3, False)
+    stop()
+    start()
+    byte(timing_addr)
+    byte(cmd2)
+    stop()
+    return steps
+
+
+class SamplePump():
+    """
+    Background sample output paced by machine.Timer.
+    Samples are register words (code << 4) in a preallocated ring: in loop mode the
+    ring holds one period that is replayed until stopped, in stream mode it is a FIFO
+    the main loop keeps topped up with write(). The timer callback has its own
+    transfer buffers, so it never allocates and never shares a buffer with the driver.
+    """
+
+    def __init__(self, dac, channel, size=PUMP_SIZE, timer_id=-1):
+        """
+        :param dac: DfrobotGP8403 instance
+        :param channel: Output channel
+        :param size: Ring size in samples, a power of two
+        :param timer_id: machine.Timer id, -1 for a virtual timer
+        """
+        if size <= 0 or size & (size - 1):
+            raise ValueError("size must be a power of two")
+        self._dac = dac
+        self._ring = array('H', bytearray(2 * size))
+        self._size = size
+        # Indices run over twice the ring size so a full ring differs from an empty one
+        self._mask = 2 * size - 1
+        self._head = 0
+        self._tail = 0
+        self._length = 0
+        self._loop = False
+        self._running = False
+        self._timer = machine.Timer(timer_id)
+        # Bound once, creating the bound method in the callback would allocate
+        self._tick_cb = self._tick
+        self._frame = bytearray(3)
+        self._reg = bytearray(1)
+        self._reg[0] = dac.GP8403_CONFIG_CURRENT_REG
+        self._pair = bytearray(4)
+        self._pair_vec = (self._reg, self._pair)
+        self.channel = channel
+        self.samples_sent = 0
+        self.underruns = 0
+
+    @property
+    def channel(self):
+        return self._channel
+
+    @channel.setter
+    def channel(self, channel):
+        self._channel = channel
+        if channel == 0 or channel == 1:
+            self._frame[0] = self._dac.GP8403_CONFIG_CURRENT_REG << channel
+
+    @property
+    def size(self):
+        return self._size
+
+    def load(self, words):
+        """
+        Switch to loop mode and replace the ring content with one period, call while stopped
+        :param words: Register words of one period, at most size of them
+        """
+        n = len(words)
+        if n > self._size:
+            raise ValueError("waveform longer than the ring")
+        ring = self._ring
+        for i in range(n):
+            ring[i] = words[i]
+        self._length = n
+        self._tail = 0
+        self._loop = True
+
+    def reset(self):
+        """
+        Switch to stream mode with an empty ring, call while stopped
+        """
+        self._head = 0
+        self._tail = 0
+        self._loop = False
+
+    def free(self):
+        """
+        :return: Number of samples write() can queue now
+        """
+        return self._size - ((self._head - self._tail) & self._mask)
+
+    def write(self, words, start=0):
+        """
+        Queue register words in stream mode without blocking
+        :param words: Register words
+        :param start: Index of the first word of words to queue
+        :return: Number of words queued, the rest did not fit
+        """
+        ring = self._ring
+        wrap = self._size - 1
+        head = self._head
+        n = min(len(words) - start, self.free())
+        for i in range(n):
+            ring[(head + i) & wrap] = words[start + i]
+        # Publish the samples only once they are in the ring
+        self._head = (head + n) & self._mask
+        return n
+
+    def start(self, sample_rate):
+        """
+        Start the timer
+        :param sample_rate: Samples per second
+        """
+        self.samples_sent = 0
+        self.underruns = 0
+        self._running = True
+        self._timer.init(mode=machine.Timer.PERIODIC, freq=sample_rate, callback=self._tick_cb)
+
+    def stop(self):
+        """
+        Stop the timer, the output holds the last sample
+        """
+        self._timer.deinit()
+        self._running = False
+
+    def is_running(self):
+        return self._running
+
+    def _tick(self, timer):
+        if self._loop:
+            i = self._tail
+            word = self._ring[i]
+            i += 1
+            if i >= self._length:
+                i = 0
+            self._tail = i
+        else:
+            tail = self._tail
+            if tail == self._head:
+                # Nothing queued, hold the last sample
+                self.underruns += 1
+                return
+            word = self._ring[tail & (self._size - 1)]
+            self._tail = (tail + 1) & self._mask
+        channel = self._channel
+        if channel == 0 or channel == 1:
+            f = self._frame
+            f[1] = word & 0xFF
+            f[2] = word >> 8
+            self._dac.i2c.writeto(self._dac._addr, f)
+        elif channel == 3:
+            p = self._pair
+            p[0] = p[2] = word & 0xFF
+            p[1] = p[3] = word >> 8
+            self._dac.i2c.writevto(self._dac._addr, self._pair_vec)
+        self.samples_sent += 1
 
 
 class DfrobotGP8403():
@@ -69,6 +374,18 @@ class DfrobotGP8403():
         self._i2cfreq = i2cfreq
         self.dataTransmission = 0
         self._hard = hard
+        # Samples per second the bus sustains, measured on the first waveform
+        self.sample_rate = None
+        self._range_mode = None
+        self._waveforms = {}
+        self._pump = None
+        self._store_steps = None
+        # Preallocated transfer buffers, so sending a sample never allocates
+        self._buf = bytearray(3)
+        self._reg_pair = bytearray(1)
+        self._reg_pair[0] = self.GP8403_CONFIG_CURRENT_REG
+        self._pair = bytearray(4)
+        self._pair_vec = (self._reg_pair, self._pair)
 
         # Need it because "store" bit bangs and uninitialize the I2C bus
         self._initializeI2C()
@@ -117,7 +434,10 @@ class DfrobotGP8403():
         b = bytearray(1)
         b[0] = mode
         self.i2c.writeto_mem(self._addr, self.outPutSetRange, b, addrsize=8)
-        
+        self._range_mode = mode
+        # Compiled waveforms depend on the range
+        self._waveforms = {}
+
     def get_dac_out_range(self):
         return self.voltage
 
@@ -132,21 +452,215 @@ class DfrobotGP8403():
         self._send_data(self.dataTransmission, channel)
         
 
-    def _send_data(self, data, channel):
-        if channel == 0 or channel == 3:
-            b = bytearray(3)
-            b[0] = self.GP8403_CONFIG_CURRENT_REG
-            b[1] = data & 0xFF
-            b[2] = (data >> 8) & 0xFF
-            self.i2c.writeto(self._addr, b)
+    def set_dac_out_voltage_pair(self, data0, data1):
+        """
+        Set different voltages on channel 0 and channel 1 in a single I2C transaction
+        :param data0: Voltage of channel 0 in mV
+        :param data1: Voltage of channel 1 in mV
+        """
+        word0 = int((float(data0) / self.voltage) * 4095) << 4
+        word1 = int((float(data1) / self.voltage) * 4095) << 4
+        self._send_pair(word0, word1)
+
+    def measure_sample_rate(self, count=32):
+        """
+        Measure how many samples per second the bus sustains.
+        Rewrites the present output range, a transaction of the same size as a sample;
+        if the range has not been set yet, single-byte reads are timed instead.
+        :param count: Number of transactions to time
+        :return: Samples per second, also kept in self.sample_rate
+        """
+        b = bytearray(1)
+        start = utime.ticks_us()
+        for _ in range(count):
+            if self._range_mode is not None:
+                b[0] = self._range_mode
+                self.i2c.writeto_mem(self._addr, self.outPutSetRange, b, addrsize=8)
+            else:
+                self.i2c.readfrom_into(self._addr, b)
+        elapsed = utime.ticks_diff(utime.ticks_us(), start)
+        self.sample_rate = count * 1000000 // elapsed if elapsed > 0 else 1000
+        return self.sample_rate
+
+    def waveform(self, shape, amp, freq, offset, duty_cycle=50):
+        """
+        Compile a waveform for the present output range, or return it from the cache
+        :param shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+        :param amp: Amplitude Vp in mV
+        :param freq: Frequency in Hz
+        :param offset: DC offset in mV
+        :param duty_cycle: Duty cycle of triangle and square waves in %
+        :return: (array('H') of register words, frame period in us)
+        """
+        if shape == WAVE_SIN:
+            duty_cycle = 50
+            if self.sample_rate is None:
+                self.measure_sample_rate()
+        key = (shape, amp, freq, offset, duty_cycle, self.voltage)
+        buf = self._waveforms.get(key)
+        if buf is None:
+            if len(self._waveforms) >= WAVEFORM_CACHE_SIZE:
+                self._waveforms.clear()
+            buf = compile_waveform(shape, amp, freq, offset, duty_cycle, self.voltage, self.sample_rate)
+            self._waveforms[key] = buf
+        return buf
+
+    def output_sin(self, amp, freq, offset, channel):
+        """
+        Output one period of a sine wave
+        :param amp: Amplitude Vp in mV
+        :param freq: Frequency in Hz
+        :param offset: DC offset in mV
+        :param channel: Output channel
+        """
+        words, frame_us = self.waveform(WAVE_SIN, amp, freq, offset)
+        self.output_buffer(words, frame_us, channel)
+
+    def output_triangle(self, amp, freq, offset, duty_cycle, channel):
+        """
+        Output one period of a triangle (sawtooth) wave
+        :param amp: Amplitude Vp in mV
+        :param freq: Frequency in Hz
+        :param offset: DC offset in mV
+        :param duty_cycle: Duty cycle in %
+        :param channel: Output channel
+        """
+        words, frame_us = self.waveform(WAVE_TRIANGLE, amp, freq, offset, duty_cycle)
+        self.output_buffer(words, frame_us, channel)
+
+    def output_square(self, amp, freq, offset, duty_cycle, channel):
+        """
+        Output one period of a square wave
+        :param amp: Amplitude Vp in mV
+        :param freq: Frequency in Hz
+        :param offset: DC offset in mV
+        :param duty_cycle: Duty cycle in %
+        :param channel: Output channel
+        """
+        words, frame_us = self.waveform(WAVE_SQUARE, amp, freq, offset, duty_cycle)
+        self.output_buffer(words, frame_us, channel)
+
+    def output_buffer(self, words, frame_us, channel, periods=1):
+        """
+        Play precomputed register words, one every frame_us.
+        The loop does not allocate, so the garbage collector never runs in the middle of a period.
+        :param words: array('H') of register words (code << 4)
+        :param frame_us: Sample period in us
+        :param channel: Output channel
+        :param periods: Number of times to play the buffer
+        """
+        if _native is not None:
+            if channel == 0 or channel == 1:
+                self._buf[0] = self.GP8403_CONFIG_CURRENT_REG << channel
+            _native.play_words(self.i2c, self._addr, self._buf, self._pair_vec, words, channel, frame_us, periods)
+            return
+        send = self._send_data
+        ticks_us = utime.ticks_us
+        ticks_add = utime.ticks_add
+        ticks_diff = utime.ticks_diff
+        deadline = ticks_us()
+        for _ in range(periods):
+            for w in words:
+                send(w, channel)
+                deadline = ticks_add(deadline, frame_us)
+                while ticks_diff(deadline, ticks_us()) > 0:
+                    pass
+
+    def to_words(self, samples):
+        """
+        Convert voltages to register words for the present output range
+        :param samples: Voltages in mV
+        :return: array('H') of register words
+        """
+        words = array('H', bytearray(2 * len(samples)))
+        k = 4095 / self.voltage
+        for i in range(len(samples)):
+            words[i] = _to_word(int(samples[i] * k))
+        return words
+
+    def pump(self, channel, size=PUMP_SIZE):
+        """
+        Get the background sample pump of the module, stopped and set to the channel.
+        The module has one pump, so one background waveform at a time.
+        :param channel: Output channel
+        :param size: Smallest ring size needed, in samples
+        :return: SamplePump
+        """
+        pump = self._pump
+        if pump is not None:
+            pump.stop()
+        if pump is None or pump.size < size:
+            n = PUMP_SIZE
+            while n < size:
+                n *= 2
+            pump = self._pump = SamplePump(self, channel, n)
+        pump.channel = channel
+        return pump
+
+    def start_waveform(self, shape, amp, freq, offset, channel, duty_cycle=50):
+        """
+        Output a waveform continuously in the background, paced by a hardware timer
+        :param shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+        :param amp: Amplitude Vp in mV
+        :param freq: Frequency in Hz
+        :param offset: DC offset in mV
+        :param channel: Output channel
+        :param duty_cycle: Duty cycle of triangle and square waves in %
+        :return: The running SamplePump
+        """
+        words, frame_us = self.waveform(shape, amp, freq, offset, duty_cycle)
+        pump = self.pump(channel, len(words))
+        pump.load(words)
+        pump.start(1000000 / frame_us)
+        return pump
+
+    def start_arbitrary(self, samples, sample_rate, channel, loop=True):
+        """
+        Output arbitrary samples in the background at a fixed sample rate.
+        With loop the samples are one period replayed until stopped; otherwise they are
+        queued and more can be streamed with pump.write(dac.to_words(...)).
+        :param samples: Voltages in mV
+        :param sample_rate: Samples per second
+        :param channel: Output channel
+        :param loop: Replay the samples until stopped
+        :return: The running SamplePump
+        """
+        words = self.to_words(samples)
+        # The ring is sized to hold every sample, none is dropped in either mode
+        pump = self.pump(channel, len(words))
+        if loop:
+            pump.load(words)
+        else:
+            pump.reset()
+            pump.write(words)
+        pump.start(sample_rate)
+        return pump
 
-        if channel == 1 or channel == 3:
-            b = bytearray(3)
-            b[0] = self.GP8403_CONFIG_CURRENT_REG << 1
+    def stop_output(self):
+        """
+        Stop the background waveform, the output holds the last sample
+        """
+        if self._pump is not None:
+            self._pump.stop()
+
+    def _send_data(self, data, channel):
+        if channel == 0 or channel == 1:
+            b = self._buf
+            b[0] = self.GP8403_CONFIG_CURRENT_REG << channel
             b[1] = data & 0xFF
             b[2] = (data >> 8) & 0xFF
             self.i2c.writeto(self._addr, b)
+        elif channel == 3:
+            self._send_pair(data, data)
 
+    def _send_pair(self, data0, data1):
+        # The register address auto-increments, so both channels go out in one transaction
+        p = self._pair
+        p[0] = data0 & 0xFF
+        p[1] = (data0 >> 8) & 0xFF
+        p[2] = data1 & 0xFF
+        p[3] = (data1 >> 8) & 0xFF
+        self.i2c.writevto(self._addr, self._pair_vec)
 
     def store(self):
         """
@@ -157,8 +671,16 @@ class DfrobotGP8403():
         """       
         # Re-initialise Pin because it was initialized 
         # with SoftI2C and we need to use it as GPIO
-        _scl = machine.Pin(self._sclpin, machine.Pin.OUT)
-        _sda = machine.Pin(self._sdapin, machine.Pin.OUT)
+        self._scl.init(machine.Pin.OUT, value=1)
+        self._sda.init(machine.Pin.OUT, value=1)
+
+        if _native is not None and _native.HAS_SIO:
+            if self._store_steps is None:
+                self._store_steps = store_steps(self._addr, self.I2C_CYCLE_BEFORE, self.I2C_CYCLE_AFTER,
+                                                self.I2C_CYCLE_TOTAL, self.GP8302_STORE_TIMING_DELAY)
+            _native.play_steps(self._store_steps, 1 << self._sclpin, 1 << self._sdapin)
+            self._initializeI2C()
+            return
 
         self._start_signal()
         self._send_byte(self.GP8302_STORE_TIMING_HEAD, 0, 3, False)
@@ -214,21 +736,22 @@ class DfrobotGP8403():
     def _recv_ack(self, ack = 0):
         ack_ = 0
         error_time = 0
-        self._sda = machine.Pin(self._sdapin, machine.Pin.IN)
+        sda = self._sda
+        sda.init(machine.Pin.IN)
 
         utime.sleep_us(self.I2C_CYCLE_BEFORE)
         self._scl.high()
         utime.sleep_us(self.I2C_CYCLE_AFTER)
-        while self._sda.value() != ack:
+        while sda.value() != ack:
             utime.sleep_us(1)
             error_time += 1
             if error_time > 250:
                 break
-        ack_ = self._sda.value() # suspicious to read the value here, should save it before the while loop?
+        ack_ = sda.value() # suspicious to read the value here, should save it before the while loop?
         utime.sleep_us(self.I2C_CYCLE_BEFORE)
         self._scl.low()
         utime.sleep_us(self.I2C_CYCLE_AFTER)
-        self._sda = machine.Pin(self._sdapin, machine.Pin.OUT)
+        sda.init(machine.Pin.OUT)
         return ack_
 
     def _send_byte(self, data, ack = 0, bits = 8, flag = True):
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*
+"""
+@file  DfrobotGP8403_native.py
+@brief Native and viper compiled hot paths of the DAC module.
+Importing this module fails on ports built without the native emitters;
+DfrobotGP8403 then keeps its bytecode implementations.
+@copyright  Copyright (c) 2023 Couillonnade
+@license  The MIT License (MIT)
+@author  [Rémi]
+@version  V1.0
+@date  2023-03-29
+@url  https://github.com/couillonnade/DFRobot_GP8403
+"""
+
+import micropython
+from micropython import const
+import utime
+import sys
+
+# RP2040 SIO registers, single-cycle set/clear of GPIO outputs
+_SIO_GPIO_OUT_SET = const(0xd0000014)
+_SIO_GPIO_OUT_CLR = const(0xd0000018)
+
+# The SIO register map of other chips (RP2350) differs, only drive registers on the RP2040
+HAS_SIO = 'RP2040' in getattr(sys.implementation, '_machine', '')
+
+
+@micropython.native
+def play_words(i2c, addr, frame, pair_vec, words, channel, frame_us, periods):
+    """
+    Native compiled loop of DfrobotGP8403.output_buffer, bus writes included,
+    so no bytecode runs between two samples
+    :param i2c: I2C or SoftI2C of the driver
+    :param addr: I2C address of the module
+    :param frame: bytearray(3) of one-channel writes, frame[0] already holding the register
+    :param pair_vec: (register bytearray(1), bytearray(4)) of both-channel writes
+    :param words: array('H') of register words
+    :param channel: Output channel
+    :param frame_us: Sample period in us
+    :param periods: Number of times to play the buffer
+    """
+    writeto = i2c.writeto
+    writevto = i2c.writevto
+    pair = pair_vec[1]
+    single = channel == 0 or channel == 1
+    dual = channel == 3
+    ticks_us = utime.ticks_us
+    ticks_add = utime.ticks_add
+    ticks_diff = utime.ticks_diff
+    deadline = ticks_us()
+    for _ in range(periods):
+        for w in words:
+            lo = w & 0xFF
+            hi = w >> 8
+            if single:
+                frame[1] = lo
+                frame[2] = hi
+                writeto(addr, frame)
+            elif dual:
+                pair[0] = lo
+                pair[1] = hi
+                pair[2] = lo
+                pair[3] = hi
+                writevto(addr, pair_vec)
+            deadline = ticks_add(deadline, frame_us)
+            while ticks_diff(deadline, ticks_us()) > 0:
+                pass
+
+
+@micropython.viper
+def play_steps(steps, scl_mask: int, sda_mask: int):
+    """
+    Play a store sequence by writing the SIO set/clear registers, both lines change together.
+    The pins must already be SIO outputs.
+    :param steps: array('H') of (levels, delay_us) pairs, levels bit 0 is SCL and bit 1 is SDA
+    :param scl_mask: 1 << SCL pin
+    :param sda_mask: 1 << SDA pin
+    """
+    out_set = ptr32(_SIO_GPIO_OUT_SET)
+    out_clr = ptr32(_SIO_GPIO_OUT_CLR)
+    s = ptr16(steps)
+    n = int(len(steps))
+    both = scl_mask | sda_mask
+    sleep_us = utime.sleep_us
+    i = 0
+    while i < n:
+        levels = s[i]
+        high = 0
+        if levels & 1:
+            high |= scl_mask
+        if levels & 2:
+            high |= sda_mask
+        out_set[0] = high
+        out_clr[0] = both ^ high
+        delay = s[i + 1]
+        if delay:
+            sleep_us(delay)
+        i += 2
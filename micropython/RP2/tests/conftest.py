@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*
+"""
+Host-side stand-ins for the MicroPython modules the driver imports, so it runs under CPython.
+"""
+import os
+import sys
+import time
+import types
+import struct
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+class Pin():
+    OUT = 1
+    IN = 0
+    # (pin id, level) after every level change, of every pin
+    trace = []
+
+    def __init__(self, id=None, mode=None, value=None, **kwargs):
+        self.id = id
+        self.level = 1 if value is None else value
+
+    def _record(self):
+        Pin.trace.append((self.id, self.level))
+
+    def init(self, mode=None, value=None, **kwargs):
+        if value is not None:
+            self.level = value
+        if mode == Pin.IN:
+            self.level = 0
+        self._record()
+
+    def high(self):
+        self.level = 1
+        self._record()
+
+    def low(self):
+        self.level = 0
+        self._record()
+
+    def value(self, v=None):
+        if v is None:
+            return self.level
+        self.level = v
+        self._record()
+
+
+class I2C():
+    def __init__(self, *args, **kwargs):
+        # Bytes of every write, register address first
+        self.log = []
+
+    def writeto(self, addr, buf):
+        self.log.append(bytes(buf))
+
+    def writevto(self, addr, vector):
+        self.log.append(b''.join(bytes(b) for b in vector))
+
+    def scan(self):
+        return [0x58]
+
+
+class Timer():
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, id=-1):
+        self.callback = None
+
+    def init(self, mode=PERIODIC, freq=1, callback=None):
+        self.freq = freq
+        self.callback = callback
+
+    def deinit(self):
+        self.callback = None
+
+    def fire(self, n):
+        """
+        Run the callback n times, as n timer periods would
+        """
+        for _ in range(n):
+            if self.callback is not None:
+                self.callback(self)
+
+
+machine = types.ModuleType('machine')
+machine.Pin = Pin
+machine.I2C = I2C
+machine.SoftI2C = I2C
+machine.Timer = Timer
+
+utime = types.ModuleType('utime')
+utime.ticks_us = lambda: int(time.perf_counter() * 1e6)
+utime.ticks_add = lambda a, b: a + b
+utime.ticks_diff = lambda a, b: a - b
+utime.sleep_us = lambda us: time.sleep(us / 1e6)
+utime.sleep = time.sleep
+
+# The emitters compile to machine code on the board, on the host the functions run as plain Python
+micropython = types.ModuleType('micropython')
+micropython.native = lambda f: f
+micropython.viper = lambda f: f
+micropython.const = lambda x: x
+
+sys.modules.setdefault('machine', machine)
+sys.modules.setdefault('utime', utime)
+sys.modules.setdefault('ustruct', struct)
+sys.modules.setdefault('micropython', micropython)
+
+
+import pytest
+
+
+@pytest.fixture
+def make_dac():
+    """
+    Factory of modules on the stand-in I2C bus, for tests needing more than one
+    """
+    from DfrobotGP8403 import DfrobotGP8403
+    return lambda: DfrobotGP8403(0x58, 1, 0, 400000)
+
+
+@pytest.fixture
+def dac(make_dac):
+    return make_dac()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*
+import DfrobotGP8403 as driver
+from DfrobotGP8403 import *
+
+
+def test_native_play_words_matches_bytecode_loop(make_dac, monkeypatch):
+    assert driver._native is not None
+    words = compile_waveform(WAVE_SIN, 1000, 100, 2500, 50, 5000, 1600)[0]
+    for channel in (0, 1, 3):
+        native = make_dac()
+        # The native loop writes the bus itself, the bytecode per-sample path stays unused
+        native._send_data = None
+        native.output_buffer(words, 1, channel, periods=2)
+        monkeypatch.setattr(driver, '_native', None)
+        bytecode = make_dac()
+        bytecode.output_buffer(words, 1, channel, periods=2)
+        monkeypatch.undo()
+        assert native.i2c.log == bytecode.i2c.log
+        assert len(native.i2c.log) == 2 * len(words)
+
+
+def _transactions(steps):
+    # Decode (levels, delay) pairs as I2C: bits are sampled on SCL rising edges,
+    # SDA falling while SCL is high starts a transaction and SDA rising ends it; the
+    # clock rise leading into the stop condition is not a data bit
+    frames = []
+    bits = None
+    scl, sda = 1, 1
+    for i in range(0, len(steps), 2):
+        new_scl, new_sda = steps[i] & 1, (steps[i] >> 1) & 1
+        if scl and new_scl and sda != new_sda:
+            if new_sda:
+                frames.append(bits[:-1])
+                bits = None
+            else:
+                bits = []
+        elif new_scl and not scl and bits is not None:
+            bits.append(new_sda)
+        scl, sda = new_scl, new_sda
+    return frames
+
+
+def _bits(*bytes_acked):
+    bits = []
+    for b in bytes_acked:
+        bits += [(b >> i) & 1 for i in range(7, -1, -1)] + [0]
+    return bits
+
+
+def test_store_steps_decode_to_store_sequence():
+    steps = store_steps(0x58, 2, 3, 5, 1000)
+    assert len(steps) % 2 == 0
+    head = [0, 1, 0]
+    assert _transactions(steps) == [
+        head,
+        _bits(0x10, 0x03),
+        _bits(0x58 << 1, *([0x00] * 8)),
+        head,
+        _bits(0x10, 0x00),
+    ]
+    assert 1000 in steps[1::2]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*
+from DfrobotGP8403 import *
+
+
+def _sent(dac, start):
+    return [b[1] | (b[2] << 8) for b in dac.i2c.log[start:]]
+
+
+def test_start_arbitrary_streams_every_sample(dac):
+    samples = [i * 5000 // 2000 for i in range(2000)]
+    start = len(dac.i2c.log)
+    pump = dac.start_arbitrary(samples, 1000, 0, loop=False)
+    pump._timer.fire(2500)
+    assert _sent(dac, start) == dac.to_words(samples).tolist()
+    assert pump.underruns == 500
+    dac.stop_output()
+
+
+def test_start_arbitrary_loops_whole_period(dac):
+    samples = [i * 5000 // 600 for i in range(600)]
+    start = len(dac.i2c.log)
+    pump = dac.start_arbitrary(samples, 1000, 1, loop=True)
+    pump._timer.fire(1200)
+    assert _sent(dac, start) == dac.to_words(samples).tolist() * 2
+    assert all(b[0] == dac.GP8403_CONFIG_CURRENT_REG << 1 for b in dac.i2c.log[start:])
+    dac.stop_output()
@@ -11,79 +11,49 @@
 '''
 from __future__ import print_function
 import sys
-import smbus
+import math
 import time
-import datetime
-import RPi.GPIO as GPIO
-
-
-FullSine5Bit = [
-  2048,2447,2831,3185,3495,3750,3939,4056,
-  4095,4056,3939,3750,3495,3185,2831,2447,
-  2048,1648,1264, 910, 600, 345, 156,  39,
-     0,  39, 156, 345, 600, 910,1264,1648]
-
-FullSine6Bit = [
-  2048, 2248, 2447, 2642, 2831, 3013, 3185, 3346,
-  3495, 3630, 3750, 3853, 3939, 4007, 4056, 4085,
-  4095, 4085, 4056, 4007, 3939, 3853, 3750, 3630,
-  3495, 3346, 3185, 3013, 2831, 2642, 2447, 2248,
-  2048, 1847, 1648, 1453, 1264, 1082,  910,  749,
-   600,  465,  345,  242,  156,   88,   39,   10,
-     0,   10,   39,   88,  156,  242,  345,  465,
-   600,  749,  910, 1082, 1264, 1453, 1648, 1847]
-
-FullSine7Bit = [
-  2048, 2148, 2248, 2348, 2447, 2545, 2642, 2737,
-  2831, 2923, 3013, 3100, 3185, 3267, 3346, 3423,
-  3495, 3565, 3630, 3692, 3750, 3804, 3853, 3898,
-  3939, 3975, 4007, 4034, 4056, 4073, 4085, 4093,
-  4095, 4093, 4085, 4073, 4056, 4034, 4007, 3975,
-  3939, 3898, 3853, 3804, 3750, 3692, 3630, 3565,
-  3495, 3423, 3346, 3267, 3185, 3100, 3013, 2923,
-  2831, 2737, 2642, 2545, 2447, 2348, 2248, 2148,
-  2048, 1947, 1847, 1747, 1648, 1550, 1453, 1358,
-  1264, 1172, 1082,  995,  910,  828,  749,  672,
-   600,  530,  465,  403,  345,  291,  242,  197,
-   156,  120,   88,   61,   39,   22,   10,    2,
-     0,    2,   10,   22,   39,   61,   88,  120,
-   156,  197,  242,  291,  345,  403,  465,  530,
-   600,  672,  749,  828,  910,  995, 1082, 1172,
-  1264, 1358, 1453, 1550, 1648, 1747, 1847, 1947]
-
-FullSine8Bit = [
-  2048, 2098, 2148, 2198, 2248, 2298, 2348, 2398,
-  2447, 2496, 2545, 2594, 2642, 2690, 2737, 2784,
-  2831, 2877, 2923, 2968, 3013, 3057, 3100, 3143,
-  3185, 3226, 3267, 3307, 3346, 3385, 3423, 3459,
-  3495, 3530, 3565, 3598, 3630, 3662, 3692, 3722,
-  3750, 3777, 3804, 3829, 3853, 3876, 3898, 3919,
-  3939, 3958, 3975, 3992, 4007, 4021, 4034, 4045,
-  4056, 4065, 4073, 4080, 4085, 4089, 4093, 4094,
-  4095, 4094, 4093, 4089, 4085, 4080, 4073, 4065,
-  4056, 4045, 4034, 4021, 4007, 3992, 3975, 3958,
-  3939, 3919, 3898, 3876, 3853, 3829, 3804, 3777,
-  3750, 3722, 3692, 3662, 3630, 3598, 3565, 3530,
-  3495, 3459, 3423, 3385, 3346, 3307, 3267, 3226,
-  3185, 3143, 3100, 3057, 3013, 2968, 2923, 2877,
-  2831, 2784, 2737, 2690, 2642, 2594, 2545, 2496,
-  2447, 2398, 2348, 2298, 2248, 2198, 2148, 2098,
-  2048, 1997, 1947, 1897, 1847, 1797, 1747, 1697,
-  1648, 1599, 1550, 1501, 1453, 1405, 1358, 1311,
-  1264, 1218, 1172, 1127, 1082, 1038,  995,  952,
-   910,  869,  828,  788,  749,  710,  672,  636,
-   600,  565,  530,  497,  465,  433,  403,  373,
-   345,  318,  291,  266,  242,  219,  197,  176,
-   156,  137,  120,  103,   88,   74,   61,   50,
-    39,   30,   22,   15,   10,    6,    2,    1,
-     0,    1,    2,    6,   10,   15,   22,   30,
-    39,   50,   61,   74,   88,  103,  120,  137,
-   156,  176,  197,  219,  242,  266,  291,  318,
-   345,  373,  403,  433,  465,  497,  530,  565,
-   600,  636,  672,  710,  749,  788,  828,  869,
-   910,  952,  995, 1038, 1082, 1127, 1172, 1218,
-  1264, 1311, 1358, 1405, 1453, 1501, 1550, 1599,
-  1648, 1697, 1747, 1797, 1847, 1897, 1947, 1997]
+import threading
+import functools
+import itertools
+import collections
+from DFRobot_GP8403_transport import *
+from DFRobot_GP8403_trace import TRACE_SIZE, SampleTrace
+from DFRobot_GP8403_calibration import Calibration, ChannelCalibration
+from DFRobot_GP8403_store import STORE_AUTO, STORE_PIGPIO, STORE_GPIOD, STORE_RPI_GPIO, SimulatedGPIOStore, store_steps, open_store_backend, restore_i2c_pins
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+# RPi.GPIO module, imported by _import_gpio() the first time store() bit-bangs
+GPIO = None
+
+
+_sine_tables = {}
+_sine_tables_lock = threading.Lock()
+
+def sine_table(points):
+  '''!
+    @brief Full-scale sine table, one period of 12-bit codes centred on 2047.5
+    @param points Number of points per period
+    @return Tuple of codes, generated once per size and cached
+  '''
+  table = _sine_tables.get(points)
+  if table is not None:
+    return table
+  if np is not None:
+    table = tuple(np.floor(2047.5 + 2047.5 * np.sin(2 * np.pi * np.arange(points) / points) + 0.5).astype(int).tolist())
+  else:
+    table = tuple(int(math.floor(2047.5 + 2047.5 * math.sin(2 * math.pi * i / points) + 0.5)) for i in range(points))
+  with _sine_tables_lock:
+    _sine_tables[points] = table
+  return table
+
+FullSine5Bit = list(sine_table(32))
+FullSine6Bit = list(sine_table(64))
+FullSine7Bit = list(sine_table(128))
+FullSine8Bit = list(sine_table(256))
 
   
 ##Select DAC output voltage of 0-5V
@@ -96,6 +66,444 @@ CHANNEL0                    =     1
 CHANNEL1                    =     2
 ##Select to output from all the channels
 CHANNELALL                  =     3
+##Waveform shape: sine
+WAVE_SIN                    =     0
+##Waveform shape: triangle (sawtooth)
+WAVE_TRIANGLE               =     1
+##Waveform shape: square
+WAVE_SQUARE                 =     2
+##Arbitrary waveform samples are given in millivolts
+UNIT_MV                     =     0
+##Arbitrary waveform samples are given as raw 12-bit DAC codes (0-4095)
+UNIT_CODE                   =     1
+##Arbitrary waveform samples are given as register words (code << 4), sent as they are
+UNIT_WORD                   =     2
+##Number of arbitrary waveform samples converted and sent per chunk
+ARBITRARY_CHUNK_SIZE        =     1024
+##Fewest points per period of a generated sine wave
+SINE_MIN_POINTS             =     16
+##Most points per period of a generated sine wave
+SINE_MAX_POINTS             =     1024
+##Sample rate assumed for the bus until it has been measured (samples/s)
+DEFAULT_SAMPLE_RATE         =     1300
+##Number of compiled waveforms kept in the LRU cache
+WAVEFORM_CACHE_SIZE         =     32
+##Late frame policy: drop the samples whose deadline has already passed
+LATE_SKIP                   =     0
+##Late frame policy: send the late samples back to back until on schedule again
+LATE_CATCH_UP               =     1
+##Ramp curve: constant slew rate
+CURVE_LINEAR                =     0
+##Ramp curve: S-curve (smoothstep), zero slew rate at both ends
+CURVE_S                     =     1
+##Ramp curve: exponential approach, fast start and slow settling
+CURVE_EXP                   =     2
+
+
+##Compiled waveform: ready-to-send 16-bit register words, the same words as dual-channel block payloads, and the frame period of each word in ns
+WaveformBuffer = collections.namedtuple('WaveformBuffer', ['words', 'blocks', 'frame_ns'])
+
+_waveform_cache = collections.OrderedDict()
+_waveform_cache_lock = threading.Lock()
+
+try:
+  _now_ns = time.perf_counter_ns
+except AttributeError:
+  def _now_ns():
+    return int(time.time() * 1000000000)
+
+
+def _sleep_until(cond, next_deadline, spin_ns, stopped=None):
+  '''!
+    @brief Wait on a held condition until the next deadline is at most spin_ns away
+    @n The deadline is looked up again after every wake-up, new work or a stop may have come in.
+    @param cond Condition held by the caller
+    @param next_deadline Function returning the next deadline in ns of the monotonic clock, None if there is none
+    @param spin_ns Busy-wait window left before the deadline in ns
+    @param stopped Function returning True to give up waiting
+    @return The deadline, None if stopped
+  '''
+  while True:
+    if stopped is not None and stopped():
+      return None
+    deadline = next_deadline()
+    if deadline is None:
+      cond.wait()
+      continue
+    remaining = deadline - _now_ns()
+    if remaining > spin_ns:
+      cond.wait((remaining - spin_ns) / 1e9)
+      continue
+    return deadline
+
+def _spin_until(deadline):
+  # Busy-wait the last stretch before a deadline, sleeping is too coarse for it
+  while _now_ns() < deadline:
+    pass
+
+
+class Pacer(object):
+  '''!
+    @brief Sample pacing on absolute monotonic deadlines.
+    @n Deadlines are start + k * frame, so timing errors never accumulate. The
+    @n pacer sleeps until spin_ns before each deadline and busy-waits the rest.
+  '''
+  ## Default busy-wait window before a deadline: 200us
+  SPIN_NS = 200000
+
+  def __init__(self,frame_ns,late_policy=LATE_SKIP,spin_ns=SPIN_NS):
+    '''!
+      @param frame_ns Sample period in ns
+      @param late_policy LATE_SKIP or LATE_CATCH_UP
+      @param spin_ns Busy-wait window before each deadline in ns
+    '''
+    self.frame_ns = frame_ns
+    self.late_policy = late_policy
+    self.spin_ns = spin_ns
+    self.late = 0
+    self.skipped = 0
+    self._deadline = 0
+
+  def start(self,t0=None):
+    '''!
+      @brief Anchor the deadline grid
+      @param t0 Start time in ns of the monotonic clock, None for now
+    '''
+    self._deadline = _now_ns() if t0 is None else t0
+    self.late = 0
+    self.skipped = 0
+
+  @property
+  def deadline(self):
+    '''!
+      @brief Deadline of the sample being sent, in ns of the monotonic clock
+    '''
+    return self._deadline
+
+  def wait(self):
+    '''!
+      @brief Wait for the next deadline
+      @return Number of samples to skip, only non-zero for LATE_SKIP when late
+    '''
+    frame = self.frame_ns
+    deadline = self._deadline + frame
+    now = _now_ns()
+    if now >= deadline:
+      self.late += 1
+      skip = 0
+      if self.late_policy == LATE_SKIP:
+        skip = int((now - deadline) // frame)
+        deadline += skip * frame
+        self.skipped += skip
+      self._deadline = deadline
+      return skip
+    remaining = deadline - now
+    if remaining > self.spin_ns:
+      time.sleep((remaining - self.spin_ns) / 1e9)
+    _spin_until(deadline)
+    self._deadline = deadline
+    return 0
+
+
+def _curve_time(curve, y):
+  # Inverse of the ramp curve: the fraction of the ramp time at which fraction y of the step is reached
+  if curve == CURVE_LINEAR:
+    return y
+  if curve == CURVE_S:
+    # Inverse of the smoothstep u * u * (3 - 2 * u)
+    return 0.5 - math.sin(math.asin(min(max(1 - 2 * y, -1.0), 1.0)) / 3)
+  if curve == CURVE_EXP:
+    # Inverse of (1 - exp(-5 * u)) / (1 - exp(-5))
+    return -math.log(1 - y * (1 - math.exp(-5))) / 5
+  raise ValueError("unknown ramp curve: %r" % (curve,))
+
+def ramp_steps(start, end, duration_ns, frame_ns, curve, word_of):
+  '''!
+    @brief Precompute a ramp at the finest useful resolution
+    @n The voltage is split into levels half a code apart and the curve is inverted for the
+    @n time each level is reached, rounded up to the next frame; only levels whose register
+    @n word changes are kept, the last one of a frame wins. The work depends on the codes
+    @n crossed, not on the ramp time.
+    @param start Start voltage in mV
+    @param end End voltage in mV
+    @param duration_ns Ramp time in ns
+    @param frame_ns Shortest time between two writes in ns
+    @param curve CURVE_LINEAR, CURVE_S or CURVE_EXP
+    @param word_of Function converting mV to the register word of the channel
+    @return List of (time from the start in ns, mV, register word), ending at end
+  '''
+  last = word_of(start)
+  # Two levels per code step, words are code << 4
+  levels = max(1, abs(word_of(end) - last) >> 3)
+  steps = []
+  for k in range(1, levels + 1):
+    y = float(k) / levels
+    mv = end if k == levels else start + (end - start) * y
+    word = word_of(mv)
+    t = int(duration_ns * _curve_time(curve, y))
+    t = min(max(-(-t // frame_ns) * frame_ns, frame_ns), duration_ns)
+    # The last level is kept even without a word change, so the ramp ends exactly at end
+    if word == last and k < levels:
+      continue
+    if steps and steps[-1][0] == t:
+      steps[-1] = (t, mv, word)
+    else:
+      steps.append((t, mv, word))
+    last = word
+  return steps
+
+
+class _RampWorker(object):
+  '''!
+    @brief Thread playing the ramps of both channels of one module on absolute deadlines
+    @n Steps of the two channels due within half a frame of each other go out as one pair write.
+  '''
+  def __init__(self,dac,frame_ns):
+    self._dac = dac
+    ## Shortest time between two writes of a channel in ns
+    self.frame_ns = frame_ns
+    self._cond = threading.Condition()
+    # Per channel: [steps, index of the next step, start time in ns] or None
+    self._plans = [None, None]
+    self._thread = threading.Thread(target=self._run, name="GP8403-ramp")
+    self._thread.daemon = True
+    self._thread.start()
+
+  def start(self,channel,steps,t0):
+    plan = [steps, 0, t0]
+    with self._cond:
+      self._plans[channel] = plan
+      self._cond.notify_all()
+    return plan
+
+  def cancel(self,channel,plan=None):
+    # With plan given, only that ramp is cancelled, not one started after it
+    with self._cond:
+      if plan is None or self._plans[channel] is plan:
+        self._plans[channel] = None
+        self._cond.notify_all()
+
+  def busy(self,channel):
+    return self._plans[channel] is not None
+
+  def wait(self,channels,timeout):
+    with self._cond:
+      return self._cond.wait_for(lambda: all(self._plans[ch] is None for ch in channels), timeout)
+
+  def _next_deadline(self):
+    due = [p[2] + p[0][p[1]][0] for p in self._plans if p is not None]
+    return min(due) if due else None
+
+  def _run(self):
+    dac = self._dac
+    cond = self._cond
+    while True:
+      with cond:
+        deadline = _sleep_until(cond, self._next_deadline, dac.spin_ns)
+        frame_ns = self.frame_ns
+      _spin_until(deadline)
+      words = [None, None]
+      # The step is written under the lock: a setpoint cancelling the ramp waits for it, so
+      # a stale step never lands after the setpoint
+      with cond:
+        for ch in (0, 1):
+          plan = self._plans[ch]
+          if plan is None:
+            continue
+          steps, i, t0 = plan
+          if t0 + steps[i][0] <= deadline + frame_ns // 2:
+            words[ch] = steps[i][2]
+            dac._setpoints[ch] = steps[i][1]
+            plan[1] = i + 1
+            if plan[1] == len(steps):
+              self._plans[ch] = None
+        if words[0] is not None and words[1] is not None:
+          dac._send_data_pair(words[0],words[1])
+        elif words[0] is not None:
+          dac._send_data(words[0],0)
+        elif words[1] is not None:
+          dac._send_data(words[1],1)
+        cond.notify_all()
+
+
+def _to_word(code):
+  if code <= 0:
+    return 0
+  if code >= 4095:
+    return 4095 << 4
+  return code << 4
+
+def _pair_block(word0, word1):
+  return [word0 & 0xFF, (word0 >> 8) & 0xFF, word1 & 0xFF, (word1 >> 8) & 0xFF]
+
+def _make_buffer(words, frame_ns):
+  words = tuple(words)
+  return WaveformBuffer(words, tuple(_pair_block(w, w) for w in words), frame_ns)
+
+def _sample_chunks(samples, unit, voltage, size=ARBITRARY_CHUNK_SIZE):
+  '''!
+    @brief Convert samples to register words, one chunk of at most size words at a time
+  '''
+  if unit == UNIT_WORD:
+    # Already in the register format, e.g. quantized by DFRobot_GP8403_synth or mapped from a file
+    if isinstance(samples, memoryview) or (np is not None and isinstance(samples, np.ndarray)):
+      for start in range(0, len(samples), size):
+        yield samples[start:start + size].tolist()
+      return
+    it = iter(samples)
+    while True:
+      chunk = list(itertools.islice(it, size))
+      if not chunk:
+        return
+      yield chunk
+  scale = 4095 / float(voltage) if unit == UNIT_MV else 1
+  if np is not None and isinstance(samples, np.ndarray):
+    for start in range(0, len(samples), size):
+      chunk = samples[start:start + size]
+      if unit == UNIT_MV:
+        chunk = chunk * scale
+      codes = np.clip(chunk.astype(np.int64), 0, 4095)
+      yield (codes << 4).tolist()
+    return
+  it = iter(samples)
+  while True:
+    chunk = list(itertools.islice(it, size))
+    if not chunk:
+      return
+    if np is not None:
+      codes = np.clip((np.asarray(chunk, dtype=float) * scale).astype(np.int64), 0, 4095)
+      yield (codes << 4).tolist()
+    else:
+      yield [_to_word(int(v * scale)) for v in chunk]
+
+def _calibrated_chunks(samples, luts, size=ARBITRARY_CHUNK_SIZE):
+  '''!
+    @brief Convert millivolt samples through calibration tables, one chunk of at most size samples at a time
+    @param luts Sequence of mV -> word tables
+    @return Chunks, each a list holding one list of words per table
+  '''
+  top = len(luts[0]) - 1
+  if np is not None and isinstance(samples, np.ndarray):
+    tables = [np.frombuffer(lut, dtype=np.uint16) for lut in luts]
+    for start in range(0, len(samples), size):
+      mv = np.clip(samples[start:start + size].astype(np.int64), 0, top)
+      yield [table[mv].tolist() for table in tables]
+    return
+  it = iter(samples)
+  while True:
+    chunk = [min(max(int(v), 0), top) for v in itertools.islice(it, size)]
+    if not chunk:
+      return
+    yield [[lut[mv] for mv in chunk] for lut in luts]
+
+def sine_points(freq, sample_rate=DEFAULT_SAMPLE_RATE):
+  '''!
+    @brief Choose the sine table size for a frequency
+    @n The largest power of two whose sample rate the bus can sustain, within SINE_MIN_POINTS and SINE_MAX_POINTS
+    @param freq Sine wave frequency f
+    @param sample_rate Achievable bus sample rate in samples per second
+    @return Number of points per period
+  '''
+  points = SINE_MIN_POINTS
+  while points < SINE_MAX_POINTS and points * 2 * freq <= sample_rate:
+    points *= 2
+  return points
+
+def _compile_sin(amp, freq, offset, voltage, points):
+  table = sine_table(points)
+  scale = (amp/float(voltage)) *2
+  dc = offset*(4096/float(voltage))
+  words = (_to_word(int((code - 2047) * scale + dc)) for code in table)
+  return _make_buffer(words, int(1000000000/(freq*points)))
+
+def _compile_triangle(amp, freq, offset, dutyCycle, voltage):
+  maxV = int(amp*(4096/float(voltage)))
+  if freq > 20:
+    num = 16
+  elif freq >= 11 and freq<=20:
+    num = 32
+  else:
+    num = 64
+  dutyCycle = min(max(dutyCycle, 0), 100)
+  up_num = (2*num)*(float(dutyCycle)/100)
+  down_num = ((2*num) - up_num)
+  if up_num  == 0:
+    up_num = 1
+  dc = int(offset*(4096/float(voltage)))
+  up_step = max(int(maxV/up_num), 1)
+  words = [_to_word(i + dc) for i in range(0,(maxV-up_step-1),up_step)]
+  if down_num > 0:
+    down_step = int(maxV/down_num)
+    words.extend(_to_word(maxV-1-(i*down_step)+dc) for i in range(0,int(down_num)))
+  return _make_buffer(words, int(1000000000/(freq*num*2)))
+
+def _compile_square(amp, freq, offset, dutyCycle, voltage):
+  maxV = int(amp*(4096/float(voltage)))
+  if freq > 20:
+    num = 16
+  elif freq >= 11 and freq<=20:
+    num = 32
+  else:
+    num = 64
+  dutyCycle = min(max(dutyCycle, 0), 100)
+  up_num = (2*num)*(float(dutyCycle)/100)
+  down_num = ((2*num) - up_num)
+  if up_num  == 0:
+    up_num = 1
+  high = _to_word(int(maxV + offset*(4096/float(voltage))))
+  low = _to_word(int(maxV - offset*(4096/float(voltage))))
+  words = (high,)*int(up_num) + (low,)*int(down_num)
+  return _make_buffer(words, int(1000000000/(freq*num*2)))
+
+def compile_waveform(shape, amp, freq, offset, dutyCycle=50, voltage=5000, points=None):
+  '''!
+    @brief Compile a waveform into a cached buffer of ready-to-send register words
+    @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+    @param amp Waveform amplitude Vp (mV)
+    @param freq Waveform frequency f (Hz)
+    @param offset Waveform DC offset Voffset (mV)
+    @param dutyCycle Duty cycle of triangle and square waves, ignored for sine
+    @param voltage Full-scale voltage of the output range (mV)
+    @param points Points per period of a sine wave, None to choose for DEFAULT_SAMPLE_RATE
+    @return WaveformBuffer, shared between calls with the same parameters
+  '''
+  if freq <= 0:
+    raise ValueError("freq must be positive")
+  if shape == WAVE_SIN:
+    dutyCycle = 0
+    if points is None:
+      points = sine_points(freq)
+  else:
+    points = 0
+  key = (shape, amp, freq, offset, dutyCycle, voltage, points)
+  with _waveform_cache_lock:
+    buf = _waveform_cache.get(key)
+    if buf is not None:
+      _waveform_cache.pop(key)
+      _waveform_cache[key] = buf
+      return buf
+  if shape == WAVE_SIN:
+    buf = _compile_sin(amp, freq, offset, voltage, points)
+  elif shape == WAVE_TRIANGLE:
+    buf = _compile_triangle(amp, freq, offset, dutyCycle, voltage)
+  elif shape == WAVE_SQUARE:
+    buf = _compile_square(amp, freq, offset, dutyCycle, voltage)
+  else:
+    raise ValueError("unknown waveform shape: %r" % (shape,))
+  with _waveform_cache_lock:
+    _waveform_cache[key] = buf
+    while len(_waveform_cache) > WAVEFORM_CACHE_SIZE:
+      _waveform_cache.popitem(last=False)
+  return buf
+
+def _import_gpio():
+  # RPi.GPIO is only needed to bit-bang store(), so it is imported on first use
+  global GPIO
+  if GPIO is None:
+    import RPi.GPIO
+    GPIO = RPi.GPIO
+  return GPIO
+
   
 class DFRobot_GP8403():
 	## Configure current sensor register   
@@ -120,16 +528,54 @@ class DFRobot_GP8403():
   GP8302_STORE_TIMING_DELAY = 0.0000010
   
     
-  def __init__(self,addr):
+  def __init__(self,addr,bus=1,transport=TRANSPORT_AUTO):
+    '''!
+      @param addr I2C address
+      @param bus I2C bus number
+      @param transport Transport name (TRANSPORT_AUTO, TRANSPORT_SMBUS, TRANSPORT_SMBUS2, TRANSPORT_DEV,
+      @n TRANSPORT_FAKE) or an object with the smbus.SMBus write_word_data/write_i2c_block_data/read_byte methods
+    '''
     self._addr = addr
     self.outPutSetRange = 0x01
     self.voltage = 5000
     self._scl     = 3
     self._sda     = 2
     self.dataTransmission = 0
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
-    self.i2c = smbus.SMBus(1)
+    self.late_policy = LATE_SKIP
+    self.spin_ns = Pacer.SPIN_NS
+    self.sample_rate = None
+    self._range_mode = None
+    self._gpio_ready = False
+    self.store_backend = STORE_AUTO
+    self._store_runner = None
+    self.batch_size = 0
+    self._batch_cache = collections.OrderedDict()
+    self.write_cache = False
+    self.coalesce_window = 0
+    self._shadow = [None, None]
+    self._pending = [None, None]
+    self._flush_timer = None
+    self._cache_lock = threading.RLock()
+    ## Bus transactions sent by the setpoint methods
+    self.writes_issued = 0
+    ## Channel updates dropped because the channel already holds the value
+    self.writes_suppressed = 0
+    ## Channel updates replaced by a newer value before they were sent
+    self.writes_coalesced = 0
+    ## SampleTrace of waveform output, None while tracing is off
+    self.trace = None
+    # Last voltage set on each channel in mV, None once unknown
+    self._setpoints = [None, None]
+    self._ramper = None
+    ## Calibration applied to setpoints and waveforms, None for the nominal mapping
+    self.calibration = None
+    # (mV -> word, nominal code -> word) tables of channel 0 and channel 1 for the present range
+    self._cal_tables = None
+    self._cal_buffers = collections.OrderedDict()
+    if hasattr(transport, 'write_word_data'):
+      self.i2c = transport
+    else:
+      self.i2c = open_transport(transport, bus)
 
 
   def begin(self):
@@ -145,11 +591,143 @@ class DFRobot_GP8403():
       @brief Set DAC output range
       @param mode Select DAC output range
     '''
+    self.flush()
     if mode == OUTPUT_RANGE_5V:
       self.voltage = 5000
     elif mode == OUTPUT_RANGE_10V :
       self.voltage = 10000
     self.i2c.write_word_data(self._addr,self.outPutSetRange,mode)
+    self._range_mode = mode
+    # The same code means another voltage now
+    self.invalidate_cache()
+    self._drop_setpoints(CHANNELALL)
+    self._compile_calibration()
+
+  def set_calibration(self,calibration):
+    '''!
+      @brief Apply a calibration to every setpoint and waveform of this module
+      @n The calibration of the present range is compiled into lookup tables once, here and
+      @n on every range change, so calibrated output costs one table index per sample.
+      @param calibration Calibration (see DFRobot_GP8403_calibration.py), None for the nominal mapping
+    '''
+    self.flush()
+    self.calibration = calibration
+    self._compile_calibration()
+    self.invalidate_cache()
+
+  def _compile_calibration(self):
+    self._cal_buffers.clear()
+    self._batch_cache.clear()
+    if self.calibration is None:
+      self._cal_tables = None
+    else:
+      self._cal_tables = (self.calibration.tables(0, self.voltage), self.calibration.tables(1, self.voltage))
+
+  def _setpoint_words(self,data):
+    # Register words of a setpoint for channel 0 and channel 1
+    if self._cal_tables is None:
+      word = int((float(data) / self.voltage) * 4095) << 4
+      return word, word
+    mv = min(max(int(data), 0), self.voltage)
+    return self._cal_tables[0][0][mv], self._cal_tables[1][0][mv]
+
+  def _calibrated(self,buf,channel):
+    '''!
+      @brief The calibrated version of a compiled waveform for a channel selection, cached
+    '''
+    if self._cal_tables is None:
+      return buf
+    key = (id(buf), channel)
+    entry = self._cal_buffers.get(key)
+    if entry is not None and entry[0] is buf:
+      return entry[1]
+    if channel == 0 or channel == 1:
+      lut = self._cal_tables[channel][1]
+      result = _make_buffer([lut[w >> 4] for w in buf.words], buf.frame_ns)
+    else:
+      lut0 = self._cal_tables[0][1]
+      lut1 = self._cal_tables[1][1]
+      words0 = tuple(lut0[w >> 4] for w in buf.words)
+      blocks = tuple(_pair_block(w0, lut1[w >> 4]) for w0, w in zip(words0, buf.words))
+      result = WaveformBuffer(words0, blocks, buf.frame_ns)
+    # Holding buf keeps its id from being reused while the entry exists
+    self._cal_buffers[key] = (buf, result)
+    while len(self._cal_buffers) > WAVEFORM_CACHE_SIZE:
+      self._cal_buffers.popitem(last=False)
+    return result
+
+  def measure_sample_rate(self,count=32):
+    '''!
+      @brief Measure how many samples per second the bus sustains
+      @n Rewrites the current output range, which is a transaction of the same size as a sample;
+      @n if the range has not been set yet, single-byte reads are timed instead.
+      @param count Number of transactions to time
+      @return Samples per second, also kept in self.sample_rate
+    '''
+    if self._range_mode is not None:
+      probe = functools.partial(self.i2c.write_word_data,self._addr,self.outPutSetRange,self._range_mode)
+    else:
+      probe = functools.partial(self.i2c.read_byte,self._addr)
+    start = _now_ns()
+    for i in range(count):
+      probe()
+    elapsed = _now_ns() - start
+    self.sample_rate = count * 1e9 / elapsed if elapsed > 0 else float(DEFAULT_SAMPLE_RATE)
+    return self.sample_rate
+
+  def waveform(self,shape,amp,freq,offset,dutyCycle=50):
+    '''!
+      @brief Compile a waveform for the present output range and bus sample rate
+      @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+      @param amp Waveform amplitude Vp
+      @param freq Waveform frequency f
+      @param offset Waveform DC offset Voffset
+      @param dutyCycle Duty cycle of triangle and square waves
+      @return WaveformBuffer
+    '''
+    points = None
+    if shape == WAVE_SIN:
+      if self.sample_rate is None:
+        self.measure_sample_rate()
+      points = sine_points(freq, self.sample_rate)
+    return compile_waveform(shape, amp, freq, offset, dutyCycle, self.voltage, points)
+
+  def set_pacing(self,late_policy=LATE_SKIP,spin_ns=Pacer.SPIN_NS):
+    '''!
+      @brief Configure how waveform samples are paced
+      @param late_policy LATE_SKIP: drop samples whose deadline has passed; LATE_CATCH_UP: send them back to back
+      @param spin_ns Busy-wait window before each sample deadline in ns, the rest of the wait sleeps
+    '''
+    self.late_policy = late_policy
+    self.spin_ns = spin_ns
+
+  def set_batching(self,size):
+    '''!
+      @brief Send waveform samples in batches of one bus call each, on transports that support it
+      @n Each batch starts at its deadline and its samples follow each other at bus speed,
+      @n which suits waveforms whose sample period is close to the bus transaction time.
+      @param size Samples per batch, at most MAX_BATCH_MESSAGES; 0 or 1 sends sample by sample
+    '''
+    if size > MAX_BATCH_MESSAGES:
+      raise ValueError("batch size must not exceed %d" % MAX_BATCH_MESSAGES)
+    self.batch_size = size
+    self._batch_cache.clear()
+
+  def set_trace(self,size=TRACE_SIZE):
+    '''!
+      @brief Record the timing of every waveform sample in self.trace
+      @n Output loops check for the trace once when they start, so tracing costs nothing while off.
+      @param size Number of samples the trace keeps; 0 turns tracing off
+      @return SampleTrace, or None when turned off
+    '''
+    self.trace = SampleTrace(size) if size > 0 else None
+    return self.trace
+
+  def _traced(self,send,pacer):
+    # The bare write function unless a trace is on
+    if self.trace is None:
+      return send
+    return self.trace.wrap(send, pacer)
 
   def set_DAC_out_voltage(self,data,channel):
     '''!
@@ -157,14 +735,242 @@ class DFRobot_GP8403():
       @param data Set output data
       @param channel Set output channel
     '''
-    self.dataTransmission = ((float(data) / self.voltage) * 4095)
-    self.dataTransmission = int(self.dataTransmission) << 4
-    self._send_data(self.dataTransmission,channel)
+    word0, word1 = self._setpoint_words(data)
+    self.dataTransmission = word1 if channel == 1 else word0
+    self._note_setpoint(data,channel)
+    if channel == 0 or channel == 1:
+      if not self.write_cache:
+        self._send_data(self.dataTransmission,channel)
+      else:
+        self._update_channels(((channel, self.dataTransmission),))
+    elif not self.write_cache:
+      self._send_data_pair(word0,word1)
+    else:
+      self._update_channels(((0, word0), (1, word1)))
+
+  def set_DAC_out_voltage_pair(self,data0,data1):
+    '''!
+      @brief Set different voltages on channel 0 and channel 1 in a single I2C transaction
+      @param data0 Output data of channel 0
+      @param data1 Output data of channel 1
+    '''
+    word0 = self._setpoint_words(data0)[0]
+    word1 = self._setpoint_words(data1)[1]
+    self._note_setpoint(data0,0)
+    self._note_setpoint(data1,1)
+    if not self.write_cache:
+      self._send_data_pair(word0,word1)
+    else:
+      self._update_channels(((0, word0), (1, word1)))
+
+  def ramp_to(self,voltage,channel,rate=None,duration=None,curve=CURVE_LINEAR,start=None,wait=False):
+    '''!
+      @brief Move the output to a voltage gradually, in the background
+      @n The steps are precomputed, one per register word change at most one per bus sample
+      @n period, and played on absolute deadlines. The ramp starts where the channel is: the
+      @n point a ramp in progress has reached, which it replaces, else the last setpoint.
+      @n Both channels ramp independently; steps due together go out in one transaction.
+      @param voltage Target voltage in mV
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @param rate Slew rate in mV/s
+      @param duration Ramp time in seconds, instead of rate
+      @param curve CURVE_LINEAR, CURVE_S or CURVE_EXP
+      @param start Voltage in mV to start from if the present one is unknown, None for 0
+      @param wait Return only once the ramp has finished
+    '''
+    self._start_ramp(voltage, channel, rate, duration, curve, start)
+    if wait:
+      self.wait_ramp(channel)
+
+  def _start_ramp(self,voltage,channel,rate,duration,curve,start):
+    '''!
+      @brief Start the ramps of ramp_to()
+      @return (channel, plan) of every ramp started, for _RampWorker.cancel()
+    '''
+    if (rate is None) == (duration is None):
+      raise ValueError("give either rate or duration")
+    if rate is not None and rate <= 0:
+      raise ValueError("rate must be positive")
+    ramper = self._ramp_worker()
+    channels = (channel,) if channel == 0 or channel == 1 else (0, 1)
+    begins = [self._setpoints[ch] for ch in channels]
+    # The ramp writes bypass the setpoint cache
+    self._forget_streamed(channel)
+    t0 = _now_ns()
+    plans = []
+    for ch, begin in zip(channels, begins):
+      if begin is None:
+        begin = 0 if start is None else start
+      span = abs(voltage - begin) / float(rate) if rate is not None else duration
+      word_of = lambda mv, ch=ch: self._setpoint_words(mv)[ch]
+      plans.append((ch, ramper.start(ch, ramp_steps(begin, voltage, int(span * 1e9), ramper.frame_ns, curve, word_of), t0)))
+    return plans
+
+  def wait_ramp(self,channel=CHANNELALL,timeout=None):
+    '''!
+      @brief Wait for ramps to finish
+      @param channel 0 or 1 for one channel, anything else for both
+      @param timeout Seconds to wait, None to wait as long as needed
+      @return True if no ramp is running on the channels
+    '''
+    if self._ramper is None:
+      return True
+    return self._ramper.wait((channel,) if channel == 0 or channel == 1 else (0, 1), timeout)
+
+  def stop_ramp(self,channel=CHANNELALL):
+    '''!
+      @brief Stop ramps where they are
+      @param channel 0 or 1 for one channel, anything else for both
+    '''
+    if self._ramper is not None:
+      for ch in ((channel,) if channel == 0 or channel == 1 else (0, 1)):
+        self._ramper.cancel(ch)
+
+  def is_ramping(self,channel=CHANNELALL):
+    '''!
+      @brief Check whether a ramp is running
+      @param channel 0 or 1 for one channel, anything else for either
+    '''
+    if self._ramper is None:
+      return False
+    return any(self._ramper.busy(ch) for ch in ((channel,) if channel == 0 or channel == 1 else (0, 1)))
+
+  def _ramp_worker(self):
+    if self._ramper is None:
+      if self.sample_rate is None:
+        self.measure_sample_rate()
+      self._ramper = _RampWorker(self, int(1e9 / self.sample_rate))
+    return self._ramper
+
+  def _note_setpoint(self,data,channel):
+    # A direct setpoint overrides a ramp of the same channel; cancel() also waits out a
+    # step being written, even the last one of a ramp that no longer shows as busy
+    for ch in ((channel,) if channel == 0 or channel == 1 else (0, 1)):
+      if self._ramper is not None:
+        self._ramper.cancel(ch)
+      self._setpoints[ch] = data
+
+  def _drop_setpoints(self,channel):
+    # Something else drives the channel now: stop its ramp and forget its voltage
+    for ch in ((channel,) if channel == 0 or channel == 1 else (0, 1)):
+      if self._ramper is not None:
+        self._ramper.cancel(ch)
+      self._setpoints[ch] = None
+
+  def set_write_cache(self,enabled=True,window=0):
+    '''!
+      @brief Remember the last code written to each channel and skip writes that would not change the output
+      @n Only set_DAC_out_voltage and set_DAC_out_voltage_pair go through the cache. The cache assumes
+      @n nothing else writes the module; call invalidate_cache() after a power cycle or a foreign write.
+      @param enabled Enable the cache
+      @param window Coalescing window in seconds: updates are held this long and only the latest
+      @n value of each channel is sent. 0 sends every changed value immediately
+    '''
+    self.flush()
+    self.write_cache = enabled
+    self.coalesce_window = window if enabled else 0
+    self.invalidate_cache()
+
+  def invalidate_cache(self,channel=None):
+    '''!
+      @brief Forget the remembered output codes, the next setpoint is always written
+      @param channel 0 or 1 to forget one channel, None for both
+    '''
+    with self._cache_lock:
+      if channel == 0 or channel == 1:
+        self._shadow[channel] = None
+      else:
+        self._shadow = [None, None]
+
+  @property
+  def writes_saved(self):
+    '''!
+      @brief Channel updates that did not cost a bus transaction
+    '''
+    return self.writes_suppressed + self.writes_coalesced
+
+  def flush(self):
+    '''!
+      @brief Send the updates held by the coalescing window now
+    '''
+    with self._cache_lock:
+      if self._flush_timer is not None:
+        self._flush_timer.cancel()
+        self._flush_timer = None
+      pending = [(ch, w) for ch, w in enumerate(self._pending) if w is not None]
+      self._pending = [None, None]
+      if pending:
+        self._write_channels(pending)
+
+  def _update_channels(self,updates):
+    with self._cache_lock:
+      if self.coalesce_window <= 0:
+        self._write_channels(updates)
+        return
+      for ch, word in updates:
+        if self._pending[ch] is not None:
+          self.writes_coalesced += 1
+        self._pending[ch] = word
+      if self._flush_timer is None:
+        self._flush_timer = threading.Timer(self.coalesce_window, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+
+  def _write_channels(self,updates):
+    shadow = self._shadow
+    changed = []
+    for ch, word in updates:
+      if shadow[ch] == word:
+        self.writes_suppressed += 1
+      else:
+        changed.append((ch, word))
+    if len(changed) == 2:
+      # Updates always come in channel order
+      self._send_data_pair(changed[0][1],changed[1][1])
+    elif changed:
+      self._send_data(changed[0][1],changed[0][0])
+    else:
+      return
+    self.writes_issued += 1
+    for ch, word in changed:
+      shadow[ch] = word
+
+  def set_store_backend(self,backend):
+    '''!
+      @brief Select how store() drives the bit-banged store sequence
+      @param backend STORE_AUTO, STORE_PIGPIO, STORE_GPIOD, STORE_RPI_GPIO, or an object with a run(steps) method
+    '''
+    self.store_backend = backend
+    self._store_runner = None
 
   def store(self):
     '''!
       @brief   Save the present current config, after the config is saved successfully, it will be enabled when the module is powered down and restarts
     '''
+    runner = self._store_runner
+    if runner is None:
+      if hasattr(self.store_backend, 'run'):
+        runner = self.store_backend
+      else:
+        runner = open_store_backend(self.store_backend, self._scl, self._sda)
+      # False marks the RPi.GPIO fallback as resolved
+      self._store_runner = runner if runner is not None else False
+    if runner:
+      runner.run(store_steps(self._addr,
+                             int(self.I2C_CYCLE_BEFORE * 1e6),
+                             int(self.I2C_CYCLE_AFTER * 1e6),
+                             int(self.I2C_CYCLE_TOTAL * 1e6),
+                             int(self.GP8302_STORE_TIMING_DELAY * 1e6)))
+      return
+    self._init_gpio()
+    try:
+      self._store_gpio()
+    finally:
+      # The pins are set up as GPIO again on the next store()
+      self._gpio_ready = False
+      restore_i2c_pins(self._scl, self._sda)
+
+  def _store_gpio(self):
     self._start_signal()
     self._send_byte(self.GP8302_STORE_TIMING_HEAD, 0, 3, False)
     self._stop_signal()
@@ -204,43 +1010,7 @@ class DFRobot_GP8403():
       @param offset Set sine wave DC offset Voffset
       @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
     '''
-    if(freq < 6):
-      num = 256
-    elif( 6 <= freq and freq <= 10):
-      num = 128
-    elif(10 < freq and freq <22):
-      num = 64
-    elif(22 <= freq and freq <= 42):
-      num = 32
-    else:
-      num = 32
-    if(freq > 42):
-      freq = 42
-    frame = int(1000000/(freq*(num+1)))
-    for i in range(0,num-1):
-      start = datetime.datetime.now()
-      if num == 256:
-        data = (FullSine8Bit[i] - 2047) * (amp/float(self.voltage)) *2
-      elif num == 128:
-        data = (FullSine7Bit[i] - 2047) * (amp/float(self.voltage)) *2
-      elif num == 64:
-        data = (FullSine6Bit[i] - 2047) * (amp/float(self.voltage)) *2
-      elif num == 32:
-        data = (FullSine5Bit[i] - 2047) * (amp/float(self.voltage)) *2
-      else:
-        data = (FullSine5Bit[i] - 2047) * (amp/float(self.voltage)) *2
-      data = int(data + offset*(4096/float(self.voltage)))
-      if data <= 0:
-        data = 0
-      if data >= 4095:
-        data = 4095
-      data = data <<4
-      self._send_data(data,channel)
-      endtime = datetime.datetime.now()
-      looptime = (endtime - start).microseconds
-      while looptime <= frame:
-        endtime = datetime.datetime.now()
-        looptime = (endtime - start).microseconds
+    self.output_buffer(self.waveform(WAVE_SIN, amp, freq, offset), channel)
 
   def output_triangle(self,amp,freq,offset,dutyCycle,channel):
     '''!
@@ -251,51 +1021,7 @@ class DFRobot_GP8403():
       @param dutyCycle Set triangle (sawtooth) wave duty cycle
       @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
     '''
-    maxV = int(amp*(4096/float(self.voltage)))
-    if freq > 20:
-      num = 16
-    elif freq >= 11 and freq<=20:
-      num = 32
-    else:
-      num = 64
-    frame = 1000000/(freq*num*2)
-    if dutyCycle > 100:
-      dutyCycle = 100
-    if dutyCycle < 0:
-      dutyCycle = 0
-    up_num = (2*num)*(float(dutyCycle)/100)
-    down_num = ((2*num) - up_num)
-    if up_num  == 0:
-      up_num = 1
-    for i in range(0,(maxV-int(maxV/up_num)-1),int(maxV/up_num)):
-      starttime = datetime.datetime.now()
-      enterV = i + int(offset*(4096/float(self.voltage)))
-      if enterV > 4095:
-        enterV = 4095
-      elif enterV < 0:
-        enterV = 0
-      enterV = enterV <<4
-      self._send_data(enterV,channel)
-      endtime = datetime.datetime.now()
-      looptime = (endtime - starttime).microseconds
-      while looptime <= frame:
-        endtime = datetime.datetime.now()
-        looptime = (endtime - starttime).microseconds
-    
-    for i in range(0,int(down_num)):
-      starttime = datetime.datetime.now()
-      enterV = maxV-1-(i*int(maxV/down_num))+int(offset*(4096/float(self.voltage)))
-      if enterV > 4095:
-        enterV = 4095
-      elif enterV < 0:
-        enterV = 0
-      enterV = enterV <<4
-      self._send_data(enterV,channel)
-      endtime = datetime.datetime.now()
-      looptime = (endtime - starttime).microseconds
-      while looptime <= frame:
-        endtime = datetime.datetime.now()
-        looptime = (endtime - starttime).microseconds
+    self.output_buffer(self.waveform(WAVE_TRIANGLE, amp, freq, offset, dutyCycle), channel)
   
   def output_square(self,amp,freq,offset,dutyCycle,channel):
     '''!
@@ -306,49 +1032,166 @@ class DFRobot_GP8403():
       @param dutyCycle Set square wave duty cycle
       @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
     '''
-    maxV = int(amp*(4096/float(self.voltage)))
-    if freq > 20:
-      num = 16
-    elif freq >= 11 and freq<=20:
-      num = 32
+    self.output_buffer(self.waveform(WAVE_SQUARE, amp, freq, offset, dutyCycle), channel)
+
+  def output_buffer(self,buf,channel):
+    '''!
+      @brief Output one period of a compiled waveform
+      @param buf WaveformBuffer returned by compile_waveform
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+    '''
+    if self.batch_size > 1 and hasattr(self.i2c, 'prepare_batch'):
+      self._output_batched(buf,channel)
+      return
+    send, words = self._sample_writer(buf,channel)
+    n = len(words)
+    pacer = Pacer(buf.frame_ns, self.late_policy, self.spin_ns)
+    send = self._traced(send, pacer)
+    pacer.start()
+    i = 0
+    while i < n:
+      send(words[i])
+      i += 1 + pacer.wait()
+
+  def _output_batched(self,buf,channel):
+    self._forget_streamed(channel)
+    batches = self._prepared_batches(buf,channel)
+    pacer = Pacer(buf.frame_ns, self.late_policy, self.spin_ns)
+    submit = self._traced(self.i2c.submit_batch, pacer)
+    pacer.start()
+    i = 0
+    while i < len(batches):
+      count, batch = batches[i]
+      submit(batch)
+      pacer.frame_ns = buf.frame_ns * count
+      i += 1 + pacer.wait()
+
+  def _prepared_batches(self,buf,channel):
+    '''!
+      @brief Split a compiled waveform into prepared transport batches, cached per buffer
+      @return List of (sample count, batch)
+    '''
+    key = (id(buf), channel)
+    entry = self._batch_cache.get(key)
+    if entry is not None and entry[0] is buf:
+      return entry[1]
+    orig = buf
+    buf = self._calibrated(buf, channel)
+    reg = self.GP8403_CONFIG_CURRENT_REG
+    if channel == 0:
+      payloads = [(reg, w & 0xFF, w >> 8) for w in buf.words]
+    elif channel == 1:
+      payloads = [(reg << 1, w & 0xFF, w >> 8) for w in buf.words]
     else:
-      num = 64
-    frame = 1000000/(freq*num*2)
-    if dutyCycle > 100:
-      dutyCycle = 100
-    if dutyCycle < 0:
-      dutyCycle = 0
-    up_num = (2*num)*(float(dutyCycle)/100)
-    down_num = ((2*num) - up_num)
-    if up_num  == 0:
-      up_num = 1
-    for i in range(int(up_num)):
-      starttime = datetime.datetime.now()
-      enterV = int(maxV + offset*(4096/float(self.voltage)))
-      if enterV > 4095:
-        enterV = 4095
-      elif enterV < 0:
-        enterV = 0
-      enterV = enterV <<4
-      self._send_data(enterV,channel)
-      endtime = datetime.datetime.now()
-      looptime = (endtime - starttime).microseconds
-      while looptime <= frame:
-        endtime = datetime.datetime.now()
-        looptime = (endtime - starttime).microseconds
-    for i in range(int(down_num)):
-      starttime = datetime.datetime.now()
-      enterV = int(maxV - offset*(4096/float(self.voltage)))
-      if enterV > 4095:
-        enterV = 4095
-      elif enterV < 0:
-        enterV = 0
-      self._send_data(enterV,channel)
-      endtime = datetime.datetime.now()
-      looptime = (endtime - starttime).microseconds
-      while looptime <= frame:
-        endtime = datetime.datetime.now()
-        looptime = (endtime - starttime).microseconds
+      payloads = [[reg] + b for b in buf.blocks]
+    size = self.batch_size
+    batches = [(len(payloads[i:i + size]), self.i2c.prepare_batch(self._addr, payloads[i:i + size]))
+               for i in range(0, len(payloads), size)]
+    # Holding buf keeps its id from being reused while the entry exists
+    self._batch_cache[key] = (orig, batches)
+    while len(self._batch_cache) > WAVEFORM_CACHE_SIZE:
+      self._batch_cache.popitem(last=False)
+    return batches
+
+  def output_arbitrary(self,samples,sample_rate,channel,loop=True,unit=UNIT_MV):
+    '''!
+      @brief Output an arbitrary waveform
+      @param samples NumPy array, memoryview, sequence, iterable or generator of samples, streamed in chunks
+      @param sample_rate Sample rate in Hz
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @param loop Repeat the samples forever; one-shot iterators and generators are played once,
+      @n no samples return at once
+      @param unit UNIT_MV: samples in millivolts; UNIT_CODE: samples are 12-bit DAC codes;
+      @n UNIT_WORD: samples are register words (code << 4), sent as they are
+    '''
+    if sample_rate <= 0:
+      raise ValueError("sample_rate must be positive")
+    if loop and iter(samples) is samples:
+      loop = False
+    send = self._bind_writer(channel)[0]
+    self._stream_payloads(lambda: self._payload_chunks(samples, unit, channel), send, sample_rate, loop)
+
+  def _stream_payloads(self,make_chunks,send,sample_rate,loop):
+    '''!
+      @brief Send chunks of bus payloads paced at sample_rate
+      @param make_chunks Function returning the chunks of one pass
+      @param send Bus write taking one payload, from _bind_writer
+    '''
+    pacer = Pacer(int(1e9 / sample_rate), self.late_policy, self.spin_ns)
+    send = self._traced(send, pacer)
+    pacer.start()
+    chunks = None
+    skip = 0
+    while True:
+      played = []
+      for items in (chunks or make_chunks()):
+        n = len(items)
+        i = skip
+        while i < n:
+          send(items[i])
+          i += 1 + pacer.wait()
+        skip = i - n
+        played.append(items)
+      if not loop or not any(played):
+        # Looping over nothing would spin forever
+        return
+      if chunks is None and len(played) == 1:
+        # A sequence that fits in one chunk is converted once and replayed
+        chunks = played
+
+  def _word_chunks(self,samples,unit,channel):
+    '''!
+      @brief Convert samples to register words in chunks, through the calibration if there is one
+      @return Chunks of (words of the channel, or of channel 0 when both are selected;
+      @n words of channel 1 when both are selected, else None)
+    '''
+    dual = channel != 0 and channel != 1
+    if unit == UNIT_MV and self._cal_tables is not None:
+      if dual:
+        luts = (self._cal_tables[0][0], self._cal_tables[1][0])
+      else:
+        luts = (self._cal_tables[channel][0],)
+      for words in _calibrated_chunks(samples, luts):
+        yield words[0], (words[1] if dual else None)
+      return
+    for words in _sample_chunks(samples, unit, self.voltage):
+      yield words, (words if dual else None)
+
+  def _payload_chunks(self,samples,unit,channel):
+    # Chunks of what the bus write bound by _bind_writer takes
+    for words, words1 in self._word_chunks(samples, unit, channel):
+      if words1 is None:
+        yield words
+      else:
+        yield [_pair_block(w0,w1) for w0, w1 in zip(words, words1)]
+
+  def _forget_streamed(self,channel):
+    # Waveform writes bypass the setpoint cache, so the remembered codes go stale
+    self._drop_setpoints(channel)
+    if self.write_cache:
+      self.flush()
+      self.invalidate_cache(channel if channel in (0, 1) else None)
+
+  def _bind_writer(self,channel):
+    '''!
+      @brief Bind the bus write for one channel selection
+      @return (write function taking one sample, True if it takes dual-channel block payloads instead of words)
+    '''
+    self._forget_streamed(channel)
+    if channel == 0:
+      return functools.partial(self.i2c.write_word_data,self._addr,self.GP8403_CONFIG_CURRENT_REG), False
+    elif channel == 1:
+      return functools.partial(self.i2c.write_word_data,self._addr,self.GP8403_CONFIG_CURRENT_REG<<1), False
+    return functools.partial(self.i2c.write_i2c_block_data,self._addr,self.GP8403_CONFIG_CURRENT_REG), True
+
+  def _sample_writer(self,buf,channel):
+    '''!
+      @brief Bind the bus write for one channel selection
+      @return (write function taking one sample, samples of buf in the matching format)
+    '''
+    send, dual = self._bind_writer(channel)
+    buf = self._calibrated(buf, channel)
+    return send, (buf.blocks if dual else buf.words)
 
   def _send_data(self,data,channel):
     if channel == 0:
@@ -357,8 +1200,21 @@ class DFRobot_GP8403():
     elif channel == 1:
       self.i2c.write_word_data(self._addr,self.GP8403_CONFIG_CURRENT_REG<<1,data)
     else:
-      self.i2c.write_word_data(self._addr,self.GP8403_CONFIG_CURRENT_REG,data)
-      self.i2c.write_word_data(self._addr,self.GP8403_CONFIG_CURRENT_REG<<1,data)
+      self._send_data_pair(data,data)
+
+  def _send_data_pair(self,data0,data1):
+    # The register address auto-increments, so both channels go out in one transaction
+    self.i2c.write_i2c_block_data(self._addr,self.GP8403_CONFIG_CURRENT_REG,_pair_block(data0,data1))
+
+  def _init_gpio(self):
+    if self._gpio_ready:
+      return
+    _import_gpio()
+    GPIO.setmode(GPIO.BCM)
+    GPIO.setwarnings(False)
+    GPIO.setup(self._scl, GPIO.OUT)
+    GPIO.setup(self._sda, GPIO.OUT)
+    self._gpio_ready = True
 
   def _start_signal(self):
     GPIO.output(self._scl, GPIO.HIGH)
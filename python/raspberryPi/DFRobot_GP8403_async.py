@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_async.py
+  @brief asyncio interface of the DAC module (Python 3.7 or later).
+  @n Bus I/O runs on worker threads so the event loop never blocks; transactions
+  @n of every bus are serialized by a per-bus lock.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from DFRobot_GP8403 import *
+
+_bus_locks = {}
+_bus_locks_guard = threading.Lock()
+_io_executor = None
+
+
+def _bus_lock(transport):
+  # Keyed by id; the entry holds the transport so the id cannot be reused
+  with _bus_locks_guard:
+    entry = _bus_locks.get(id(transport))
+    if entry is None or entry[0] is not transport:
+      entry = _bus_locks[id(transport)] = (transport, threading.Lock())
+    return entry[1]
+
+
+def _default_executor():
+  global _io_executor
+  with _bus_locks_guard:
+    if _io_executor is None:
+      _io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="GP8403-io")
+    return _io_executor
+
+
+def _settle(future,error):
+  # Runs on the event loop, the future may have been cancelled meanwhile
+  if future.done():
+    return
+  if error is None:
+    future.set_result(None)
+  else:
+    future.set_exception(error)
+
+
+class AsyncGP8403(object):
+  '''!
+    @brief asyncio facade over a DFRobot_GP8403 instance
+  '''
+
+  def __init__(self,dac,executor=None):
+    '''!
+      @param dac DFRobot_GP8403 instance
+      @param executor concurrent.futures executor for setpoint I/O, None for a shared pool
+    '''
+    self.dac = dac
+    self._executor = executor
+    self._lock = _bus_lock(dac.i2c)
+    # Stop events of the waveforms playing
+    self._plays = set()
+
+  async def _run(self,fn,*args):
+    lock = self._lock
+    def locked():
+      with lock:
+        return fn(*args)
+    return await asyncio.get_running_loop().run_in_executor(self._executor or _default_executor(), locked)
+
+  async def begin(self):
+    '''!
+      @brief Initialize the sensor
+      @return 0 on success, like DFRobot_GP8403.begin
+    '''
+    return await self._run(self.dac.begin)
+
+  async def set_outrange(self,mode):
+    '''!
+      @brief Set DAC output range
+      @param mode OUTPUT_RANGE_5V or OUTPUT_RANGE_10V
+    '''
+    await self._run(self.dac.set_DAC_outrange, mode)
+
+  async def set_voltage(self,data,channel):
+    '''!
+      @brief Set the output voltage
+      @param data Voltage in mV
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+    '''
+    await self._run(self.dac.set_DAC_out_voltage, data, channel)
+
+  async def set_voltage_pair(self,data0,data1):
+    '''!
+      @brief Set different voltages on the two channels in one transaction
+      @param data0 Voltage of channel 0 in mV
+      @param data1 Voltage of channel 1 in mV
+    '''
+    await self._run(self.dac.set_DAC_out_voltage_pair, data0, data1)
+
+  async def store(self):
+    '''!
+      @brief Save the present config in the module
+    '''
+    await self._run(self.dac.store)
+
+  def play(self,shape,amp,freq,offset,channel,dutyCycle=50,periods=None):
+    '''!
+      @brief Start a waveform as an asyncio task
+      @n Cancelling the task stops the output within one sample.
+      @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+      @param amp Waveform amplitude Vp
+      @param freq Waveform frequency f
+      @param offset Waveform DC offset Voffset
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @param dutyCycle Duty cycle of triangle and square waves
+      @param periods Number of periods to play, None to play until cancelled
+      @return asyncio.Task
+    '''
+    return asyncio.ensure_future(self._play(shape, amp, freq, offset, channel, dutyCycle, periods))
+
+  async def output_sin(self,amp,freq,offset,channel):
+    '''!
+      @brief Output one period of a sine wave
+    '''
+    await self.play(WAVE_SIN, amp, freq, offset, channel, periods=1)
+
+  async def output_triangle(self,amp,freq,offset,dutyCycle,channel):
+    '''!
+      @brief Output one period of a triangle wave
+    '''
+    await self.play(WAVE_TRIANGLE, amp, freq, offset, channel, dutyCycle, periods=1)
+
+  async def output_square(self,amp,freq,offset,dutyCycle,channel):
+    '''!
+      @brief Output one period of a square wave
+    '''
+    await self.play(WAVE_SQUARE, amp, freq, offset, channel, dutyCycle, periods=1)
+
+  def close(self):
+    '''!
+      @brief Stop the waveforms still playing, their tasks finish within one sample
+    '''
+    for stop in list(self._plays):
+      stop.set()
+
+  async def _play(self,shape,amp,freq,offset,channel,dutyCycle,periods):
+    buf = await self._run(self.dac.waveform, shape, amp, freq, offset, dutyCycle)
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    stop = threading.Event()
+    def run():
+      error = None
+      try:
+        self._play_blocking(buf, channel, periods, stop)
+      except BaseException as e:
+        error = e
+      loop.call_soon_threadsafe(_settle, done, error)
+    # A waveform holds its thread for its whole duration, so every play gets its own
+    # instead of queueing behind the others in a pool
+    thread = threading.Thread(target=run, name="GP8403-wave")
+    thread.daemon = True
+    self._plays.add(stop)
+    thread.start()
+    try:
+      await asyncio.shield(done)
+    except asyncio.CancelledError:
+      stop.set()
+      await asyncio.wait([done])
+      raise
+    finally:
+      self._plays.discard(stop)
+
+  def _play_blocking(self,buf,channel,periods,stop):
+    dac = self.dac
+    lock = self._lock
+    # Binding may flush the write cache, which is bus I/O too
+    with lock:
+      send, words = dac._sample_writer(buf, channel)
+    n = len(words)
+    pacer = Pacer(buf.frame_ns, dac.late_policy, dac.spin_ns)
+    send = dac._traced(send, pacer)
+    pacer.start()
+    count = 0
+    while periods is None or count < periods:
+      i = 0
+      while i < n:
+        if stop.is_set():
+          return
+        with lock:
+          send(words[i])
+        i += 1 + pacer.wait()
+      count += 1
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_bank.py
+  @brief Drive several DAC modules on one or more I2C buses as one bank of channels.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+from __future__ import print_function
+import threading
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from DFRobot_GP8403 import *
+
+##Addresses a module can be strapped to
+GP8403_ADDRESSES            =     range(0x58, 0x60)
+
+
+class _Job(object):
+  def __init__(self,fn,args):
+    self.fn = fn
+    self.args = args
+    self.error = None
+    self.done = threading.Event()
+
+
+class _BusWorker(object):
+  '''!
+    @brief Thread that runs every transaction of one bus, so buses work in parallel
+  '''
+  def __init__(self,bus):
+    self._jobs = queue.Queue()
+    self._thread = threading.Thread(target=self._run, name="GP8403-bus%d" % bus)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def submit(self,fn,*args):
+    job = _Job(fn, args)
+    self._jobs.put(job)
+    return job
+
+  def stop(self):
+    self._jobs.put(None)
+    self._thread.join()
+
+  def _run(self):
+    while True:
+      job = self._jobs.get()
+      if job is None:
+        return
+      try:
+        job.fn(*job.args)
+      except Exception as e:
+        job.error = e
+      finally:
+        job.done.set()
+
+
+class GP8403Bank(object):
+  '''!
+    @brief A rack of DAC modules seen as one vector of 2 x N channels.
+    @n Channels are ordered by bus, then address, then channel 0 before channel 1.
+    @n Every bus is opened once and shared by all modules on it.
+  '''
+
+  def __init__(self,buses=(1,),addresses=GP8403_ADDRESSES,transport=TRANSPORT_AUTO):
+    '''!
+      @param buses I2C bus numbers to scan
+      @param addresses Addresses to probe on every bus
+      @param transport Transport name, or a dict of bus number -> transport object
+    '''
+    self._buses = list(buses)
+    self._addresses = list(addresses)
+    self._transport = transport
+    self._transports = {}
+    self._workers = {}
+    ## Discovered modules, in channel order
+    self.devices = []
+    # bus -> [(index of the module's first channel, module)]
+    self._groups = {}
+
+  def _bus_transport(self,bus):
+    if bus not in self._transports:
+      if isinstance(self._transport, dict):
+        self._transports[bus] = self._transport[bus]
+      else:
+        self._transports[bus] = open_transport(self._transport, bus)
+    return self._transports[bus]
+
+  def begin(self):
+    '''!
+      @brief Probe every address on every bus and keep the modules that answer
+      @return Number of modules found
+    '''
+    self.devices = []
+    self._groups = {}
+    for bus in self._buses:
+      transport = self._bus_transport(bus)
+      for addr in self._addresses:
+        try:
+          transport.read_byte(addr)
+        except (IOError, OSError):
+          continue
+        dev = DFRobot_GP8403(addr, bus, transport)
+        self._groups.setdefault(bus, []).append((2 * len(self.devices), dev))
+        self.devices.append(dev)
+    if len(self._groups) > 1:
+      for bus in self._groups:
+        if bus not in self._workers:
+          self._workers[bus] = _BusWorker(bus)
+    return len(self.devices)
+
+  def __len__(self):
+    return 2 * len(self.devices)
+
+  def set_DAC_outrange(self,mode):
+    '''!
+      @brief Set the output range of every module
+      @param mode OUTPUT_RANGE_5V or OUTPUT_RANGE_10V
+    '''
+    self._run_per_bus(lambda devs: [dev.set_DAC_outrange(mode) for i, dev in devs])
+
+  def set_voltages(self,values):
+    '''!
+      @brief Apply one setpoint per channel, one transaction per module, buses in parallel
+      @param values Sequence of len(bank) voltages in mV, in channel order
+    '''
+    if len(values) != len(self):
+      raise ValueError("expected %d values, got %d" % (len(self), len(values)))
+    def apply(devs):
+      for i, dev in devs:
+        dev.set_DAC_out_voltage_pair(values[i], values[i + 1])
+    self._run_per_bus(apply)
+
+  def set_voltage(self,index,value):
+    '''!
+      @brief Set a single channel of the bank
+      @param index Channel index in the bank
+      @param value Voltage in mV
+    '''
+    self.devices[index // 2].set_DAC_out_voltage(value, index % 2)
+
+  def store(self):
+    '''!
+      @brief Save the present config of every module
+    '''
+    for dev in self.devices:
+      dev.store()
+
+  def close(self):
+    '''!
+      @brief Stop the bus workers and close the buses opened by the bank
+    '''
+    for worker in self._workers.values():
+      worker.stop()
+    self._workers = {}
+    if not isinstance(self._transport, dict):
+      for transport in self._transports.values():
+        transport.close()
+    self._transports = {}
+
+  def _run_per_bus(self,fn):
+    if not self._workers:
+      for devs in self._groups.values():
+        fn(devs)
+      return
+    jobs = [self._workers[bus].submit(fn, devs) for bus, devs in self._groups.items()]
+    for job in jobs:
+      job.done.wait()
+    for job in jobs:
+      if job.error is not None:
+        raise job.error
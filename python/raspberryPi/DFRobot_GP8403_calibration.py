@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_calibration.py
+  @brief Per-channel, per-range calibration of the DAC module.
+  @n A channel is described by a linear model (gain and offset of the measured output)
+  @n or by measured (code, mV) points joined piecewise linearly. Models are compiled once
+  @n into lookup tables of register words, so calibrated output costs one index per sample.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import json
+import bisect
+from array import array
+
+
+def _range_key(voltage):
+  return '%dV' % (voltage // 1000)
+
+
+def _word(code):
+  code = int(code + 0.5)
+  if code <= 0:
+    return 0
+  if code >= 4095:
+    return 4095 << 4
+  return code << 4
+
+
+class ChannelCalibration(object):
+  '''!
+    @brief Model of one channel in one output range
+  '''
+
+  def __init__(self,gain=1.0,offset=0.0,points=None):
+    '''!
+      @param gain Measured output / ideal output of the linear model
+      @param offset Measured output at code 0 in mV, of the linear model
+      @param points Measured (code, mV) pairs, at least two; replaces the linear model
+    '''
+    self.gain = float(gain)
+    self.offset = float(offset)
+    self.points = None
+    if points is not None:
+      points = sorted((float(mv), float(code)) for code, mv in points)
+      if len(points) < 2:
+        raise ValueError("at least two calibration points are needed")
+      for a, b in zip(points, points[1:]):
+        if b[0] <= a[0]:
+          raise ValueError("calibration points must have increasing voltages")
+      self.points = points
+    elif self.gain <= 0:
+      raise ValueError("gain must be positive")
+
+  def code(self,mv,full):
+    '''!
+      @brief DAC code giving mv, before rounding and clamping
+      @param mv Wanted output in mV
+      @param full Full-scale voltage of the output range in mV
+    '''
+    if self.points is None:
+      return (mv - self.offset) / self.gain * 4095 / full
+    points = self.points
+    i = bisect.bisect_left(points, (mv,))
+    # Beyond the measured points the end segments are extended
+    i = min(max(i, 1), len(points) - 1)
+    (mv0, code0), (mv1, code1) = points[i - 1], points[i]
+    return code0 + (mv - mv0) * (code1 - code0) / (mv1 - mv0)
+
+  def tables(self,full):
+    '''!
+      @brief Compile the lookup tables for an output range
+      @param full Full-scale voltage of the output range in mV
+      @return (array('H') mV -> register word, array('H') nominal waveform code -> register word)
+    '''
+    mv_words = array('H', [_word(self.code(mv, full)) for mv in range(full + 1)])
+    code_words = array('H', [_word(self.code(code * full / 4096.0, full)) for code in range(4096)])
+    return mv_words, code_words
+
+  def to_dict(self):
+    if self.points is not None:
+      return {'points': [[code, mv] for mv, code in self.points]}
+    return {'gain': self.gain, 'offset': self.offset}
+
+  @classmethod
+  def from_dict(cls,d):
+    return cls(d.get('gain', 1.0), d.get('offset', 0.0), d.get('points'))
+
+
+class Calibration(object):
+  '''!
+    @brief Calibration of one module: a ChannelCalibration per channel and output range
+    @n JSON layout: {"id": "...", "ranges": {"5V": {"0": {"gain": 1.002, "offset": -3.5},
+    @n "1": {"points": [[0, 2.1], [2048, 2501.0], [4095, 4997.2]]}}, "10V": {...}}}.
+    @n A file may also hold several modules as {"devices": {"0x58": {...}, "0x59": {...}}}.
+  '''
+
+  def __init__(self,id=None):
+    '''!
+      @param id Identifier of the calibration, e.g. the board serial number
+    '''
+    self.id = id
+    self._channels = {}
+    self._tables = {}
+
+  def set(self,channel,voltage,model):
+    '''!
+      @brief Set the model of one channel in one range
+      @param channel 0 or 1
+      @param voltage Full-scale voltage of the range in mV: 5000 or 10000
+      @param model ChannelCalibration, None to remove it
+    '''
+    key = (channel, _range_key(voltage))
+    if model is None:
+      self._channels.pop(key, None)
+    else:
+      self._channels[key] = model
+    self._tables.pop((channel, voltage), None)
+
+  def get(self,channel,voltage):
+    '''!
+      @return ChannelCalibration of the channel in the range, None if uncalibrated
+    '''
+    return self._channels.get((channel, _range_key(voltage)))
+
+  def tables(self,channel,voltage):
+    '''!
+      @brief Compiled lookup tables of a channel, built on first use
+      @return (mV -> word, nominal code -> word) as returned by ChannelCalibration.tables;
+      @n an uncalibrated channel gets the tables of the ideal model
+    '''
+    key = (channel, voltage)
+    if key not in self._tables:
+      model = self.get(channel, voltage) or ChannelCalibration()
+      self._tables[key] = model.tables(voltage)
+    return self._tables[key]
+
+  def to_dict(self):
+    ranges = {}
+    for (channel, rng), model in sorted(self._channels.items()):
+      ranges.setdefault(rng, {})[str(channel)] = model.to_dict()
+    return {'id': self.id, 'ranges': ranges}
+
+  @classmethod
+  def from_dict(cls,d):
+    cal = cls(d.get('id'))
+    for rng, channels in d.get('ranges', {}).items():
+      voltage = int(rng.rstrip('Vv')) * 1000
+      for channel, model in channels.items():
+        cal.set(int(channel), voltage, ChannelCalibration.from_dict(model))
+    return cal
+
+  def save(self,path):
+    '''!
+      @brief Write the calibration to a JSON file
+    '''
+    with open(path, 'w') as f:
+      json.dump(self.to_dict(), f, indent=2)
+
+  @classmethod
+  def load(cls,path,addr=None):
+    '''!
+      @brief Read a calibration from a JSON file
+      @param path File name
+      @param addr I2C address of the module, to pick it from a file holding several modules
+      @return Calibration
+    '''
+    with open(path) as f:
+      d = json.load(f)
+    if 'devices' in d:
+      devices = dict((int(k, 0), v) for k, v in d['devices'].items())
+      if addr not in devices:
+        raise KeyError("no calibration for address %s in %s" % (hex(addr) if addr is not None else None, path))
+      d = devices[addr]
+    return cls.from_dict(d)
@@ -0,0 +1,661 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_player.py
+  @brief Background waveform playback for the DAC module.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+from __future__ import print_function
+import threading
+from array import array
+
+from DFRobot_GP8403 import *
+from DFRobot_GP8403 import _now_ns, _pair_block, _to_word, _make_buffer
+
+##Underrun policy: leave the output at the last sample
+UNDERRUN_HOLD               =     0
+##Underrun policy: output 0V until samples arrive
+UNDERRUN_ZERO               =     1
+##Underrun policy: replay the most recent samples until new ones arrive
+UNDERRUN_REPEAT             =     2
+##Points of the DDS waveform table, a power of two
+DDS_TABLE_POINTS            =     4096
+
+
+class _Playback(object):
+  '''!
+    @brief Playback thread lifecycle shared by the players
+    @n Subclasses implement _run(), and _prepare() to check and reset their own state at start().
+  '''
+  _thread_name = "GP8403-player"
+
+  def __init__(self,dac):
+    self._dac = dac
+    self._thread = None
+    self._stop_event = threading.Event()
+    # Set while no thread runs, so nothing waits for one that never comes
+    self._stop_event.set()
+    ## Samples written to the DAC
+    self.samples_sent = 0
+    ## Samples sent later than their deadline
+    self.missed_deadlines = 0
+    self._start_time = 0
+    self._stop_time = 0
+
+  @property
+  def sample_rate(self):
+    '''!
+      @brief Achieved sample rate in samples per second since start()
+    '''
+    end = _now_ns() if self.is_running() else self._stop_time
+    elapsed = end - self._start_time
+    if elapsed <= 0:
+      return 0.0
+    return self.samples_sent * 1e9 / elapsed
+
+  def start(self):
+    '''!
+      @brief Start the playback thread
+    '''
+    if self.is_running():
+      return
+    args = self._prepare()
+    self._stop_event.clear()
+    self.samples_sent = 0
+    self.missed_deadlines = 0
+    self._thread = threading.Thread(target=self._run, args=args, name=self._thread_name)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self,timeout=None):
+    '''!
+      @brief Stop the playback thread
+      @param timeout Seconds to wait for the thread, None to wait forever
+    '''
+    self._stop_event.set()
+    self._wake()
+    if self._thread is not None:
+      self._thread.join(timeout)
+      self._thread = None
+
+  def is_running(self):
+    '''!
+      @brief Check whether the playback thread is running
+      @return True if running
+    '''
+    return self._thread is not None and self._thread.is_alive()
+
+  def _prepare(self):
+    # Check the player can start and reset its own counters; returns the arguments of _run()
+    return ()
+
+  def _wake(self):
+    # Wake the thread from waits other than on the stop event
+    pass
+
+
+class WaveformPlayer(_Playback):
+  '''!
+    @brief Play a waveform continuously on a dedicated thread.
+    @n Parameter changes are compiled by the caller and picked up by the
+    @n playback thread at the next period boundary, so the stream never stops.
+    @n stop() lets the current period finish.
+  '''
+
+  def __init__(self,dac,channel):
+    '''!
+      @param dac DFRobot_GP8403 instance
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+    '''
+    super(WaveformPlayer, self).__init__(dac)
+    self._channel = channel
+    self._params = None
+    self._next = None
+    # Set when another player takes the channel, the period is not finished then
+    self._abandon = False
+    self.periods = 0
+
+  def set_waveform(self,shape,amp,freq,offset,dutyCycle=50):
+    '''!
+      @brief Select the waveform to play, applied at the next period boundary
+      @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+      @param amp Waveform amplitude Vp
+      @param freq Waveform frequency f
+      @param offset Waveform DC offset Voffset
+      @param dutyCycle Duty cycle of triangle and square waves
+    '''
+    self._params = (shape, amp, freq, offset, dutyCycle)
+    self._next = self._dac.waveform(shape, amp, freq, offset, dutyCycle)
+
+  def retune(self,amp=None,freq=None,offset=None,dutyCycle=None):
+    '''!
+      @brief Change some parameters of the current waveform, applied at the next period boundary
+      @param amp New amplitude Vp, None to keep the current one
+      @param freq New frequency f, None to keep the current one
+      @param offset New DC offset Voffset, None to keep the current one
+      @param dutyCycle New duty cycle, None to keep the current one
+    '''
+    if self._params is None:
+      raise RuntimeError("set_waveform() must be called before retune()")
+    shape, cur_amp, cur_freq, cur_offset, cur_duty = self._params
+    self.set_waveform(shape,
+                      cur_amp if amp is None else amp,
+                      cur_freq if freq is None else freq,
+                      cur_offset if offset is None else offset,
+                      cur_duty if dutyCycle is None else dutyCycle)
+
+  def _prepare(self):
+    if self._next is None:
+      raise RuntimeError("set_waveform() must be called before start()")
+    self._abandon = False
+    self.periods = 0
+    return ()
+
+  def _yield_channel(self):
+    # Stop at the next sample without waiting, another player is taking the channel
+    self._abandon = True
+    self._stop_event.set()
+
+  def _run(self):
+    dac = self._dac
+    channel = self._channel
+    stop = self._stop_event
+    pacer = Pacer(self._next.frame_ns, dac.late_policy, dac.spin_ns)
+    # Bound once, rebinding every period would also drop the write cache each time
+    send, dual = dac._bind_writer(channel)
+    send = dac._traced(send, pacer)
+    buf = tables = words = None
+    self._start_time = _now_ns()
+    pacer.start(self._start_time)
+    try:
+      while not stop.is_set():
+        if self._next is not buf or dac._cal_tables is not tables:
+          buf = self._next
+          tables = dac._cal_tables
+          cal = dac._calibrated(buf, channel)
+          words = cal.blocks if dual else cal.words
+          pacer.frame_ns = buf.frame_ns
+        n = len(words)
+        i = 0
+        while i < n and not self._abandon:
+          send(words[i])
+          self.samples_sent += 1
+          i += 1 + pacer.wait()
+        self.missed_deadlines = pacer.late
+        self.periods += 1
+    finally:
+      self._stop_time = _now_ns()
+
+
+class DualChannelSequencer(_Playback):
+  '''!
+    @brief Play independent waveforms on channel 0 and channel 1 from one thread.
+    @n Both tracks are stepped through their compiled buffers by 32-bit phase
+    @n accumulators on a common sample clock, so each keeps its own frequency
+    @n and phase while the two channels are written together.
+  '''
+  ## Phase accumulator resolution
+  PHASE_BITS = 32
+  _thread_name = "GP8403-sequencer"
+
+  def __init__(self,dac,sample_rate=None,combined=True):
+    '''!
+      @param dac DFRobot_GP8403 instance
+      @param sample_rate Common sample rate in Hz, None to use the faster of the two tracks' own rates
+      @param combined True: both channels in one block transaction; False: two interleaved word writes
+    '''
+    super(DualChannelSequencer, self).__init__(dac)
+    self._rate = sample_rate
+    self._combined = combined
+    self._active_rate = 0.0
+    self._tracks = [None, None]
+    self._params = [None, None]
+
+  def set_track(self,channel,shape,amp,freq,offset,dutyCycle=50,phase=0):
+    '''!
+      @brief Set the waveform of one channel, may be called while playing
+      @param channel Output channel. 0: channel 0; 1: channel 1
+      @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+      @param amp Waveform amplitude Vp
+      @param freq Waveform frequency f
+      @param offset Waveform DC offset Voffset
+      @param dutyCycle Duty cycle of triangle and square waves
+      @param phase Phase offset of the track in degrees
+    '''
+    if channel not in (0, 1):
+      raise ValueError("channel must be 0 or 1")
+    buf = self._dac._calibrated(self._dac.waveform(shape, amp, freq, offset, dutyCycle), channel)
+    self._params[channel] = (buf, freq, phase)
+    rate = self._active_rate if self.is_running() else self.sample_rate_target
+    self._tracks[channel] = self._make_track(buf, freq, phase, rate)
+
+  def clear_track(self,channel):
+    '''!
+      @brief Stop driving one channel, its output holds the last value
+      @param channel Output channel. 0: channel 0; 1: channel 1
+    '''
+    self._params[channel] = None
+    self._tracks[channel] = None
+
+  @property
+  def sample_rate_target(self):
+    '''!
+      @brief Common sample rate in Hz the tracks will be played at, fixed while running
+    '''
+    if self._rate is not None:
+      return float(self._rate)
+    rates = [1e9 / p[0].frame_ns for p in self._params if p is not None]
+    return max(rates) if rates else 0.0
+
+  def _prepare(self):
+    if self._params[0] is None and self._params[1] is None:
+      raise RuntimeError("set_track() must be called before start()")
+    # The common rate may have changed since the tracks were set
+    rate = self._active_rate = self.sample_rate_target
+    for ch in (0, 1):
+      if self._params[ch] is not None:
+        buf, freq, phase = self._params[ch]
+        self._tracks[ch] = self._make_track(buf, freq, phase, rate)
+    return (rate,)
+
+  def _make_track(self,buf,freq,phase,rate):
+    if rate <= 0:
+      return None
+    full = 1 << self.PHASE_BITS
+    step = int(float(freq) / rate * full) % full
+    start = int((phase % 360) / 360.0 * full)
+    return (buf.words, len(buf.words), step, start)
+
+  def _run(self,rate):
+    dac = self._dac
+    addr = dac._addr
+    reg = dac.GP8403_CONFIG_CURRENT_REG
+    combined = self._combined
+    tracks = self._tracks
+    dac._forget_streamed(CHANNELALL)
+    bits = self.PHASE_BITS
+    mask = (1 << bits) - 1
+    acc0 = acc1 = 0
+    stop = self._stop_event
+    pacer = Pacer(int(1e9 / rate), dac.late_policy, dac.spin_ns)
+    write_word = dac._traced(dac.i2c.write_word_data, pacer)
+    write_block = dac._traced(dac.i2c.write_i2c_block_data, pacer)
+    self._start_time = _now_ns()
+    pacer.start(self._start_time)
+    try:
+      while not stop.is_set():
+        t0 = tracks[0]
+        t1 = tracks[1]
+        if t0 is not None and t1 is not None:
+          w0 = t0[0][(((acc0 + t0[3]) & mask) * t0[1]) >> bits]
+          w1 = t1[0][(((acc1 + t1[3]) & mask) * t1[1]) >> bits]
+          if combined:
+            write_block(addr,reg,_pair_block(w0,w1))
+          else:
+            write_word(addr,reg,w0)
+            write_word(addr,reg<<1,w1)
+        elif t0 is not None:
+          write_word(addr,reg,t0[0][(((acc0 + t0[3]) & mask) * t0[1]) >> bits])
+        elif t1 is not None:
+          write_word(addr,reg<<1,t1[0][(((acc1 + t1[3]) & mask) * t1[1]) >> bits])
+        self.samples_sent += 1
+        skip = 1 + pacer.wait()
+        if t0 is not None:
+          acc0 = (acc0 + t0[2] * skip) & mask
+        if t1 is not None:
+          acc1 = (acc1 + t1[2] * skip) & mask
+        self.missed_deadlines = pacer.late
+    finally:
+      self._stop_time = _now_ns()
+
+
+def _copy_wrapped(ring, start, words, pos, count):
+  # Copy words[pos:pos + count] into ring from index start on, wrapping at the end
+  first = min(count, len(ring) - start)
+  ring[start:start + first] = array('H', words[pos:pos + first])
+  if count > first:
+    ring[0:count - first] = array('H', words[pos + first:pos + count])
+
+
+class StreamSink(_Playback):
+  '''!
+    @brief Output samples pushed by a producer at a fixed rate.
+    @n Samples are converted to register words when written and kept in a bounded,
+    @n preallocated ring; a consumer thread writes one per sample period.
+    @n write() blocks while the ring is full, so a faster producer is held back.
+    @n stop() keeps the queued samples.
+  '''
+  _thread_name = "GP8403-stream"
+  ## Sample rate in Hz the sink plays at, set by the constructor
+  sample_rate = None
+
+  def __init__(self,dac,channel,sample_rate,size=4096,underrun=UNDERRUN_HOLD,unit=UNIT_MV):
+    '''!
+      @param dac DFRobot_GP8403 instance
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @param sample_rate Sample rate in Hz
+      @param size Ring capacity in samples
+      @param underrun UNDERRUN_HOLD, UNDERRUN_ZERO or UNDERRUN_REPEAT
+      @param unit UNIT_MV: samples in millivolts; UNIT_CODE: samples are 12-bit DAC codes;
+      @n UNIT_WORD: samples are register words (code << 4)
+    '''
+    if sample_rate <= 0:
+      raise ValueError("sample_rate must be positive")
+    if size <= 0:
+      raise ValueError("size must be positive")
+    super(StreamSink, self).__init__(dac)
+    self._channel = channel
+    self._unit = unit
+    self.sample_rate = sample_rate
+    self.underrun = underrun
+    self._ring = array('H', [0]) * size
+    # Words of channel 1 when both channels are driven, their calibrations may differ
+    self._ring1 = array('H', [0]) * size if channel != 0 and channel != 1 else None
+    self._size = size
+    # Free-running counts of samples written and consumed
+    self._head = 0
+    self._tail = 0
+    # Slots from _head on that write() is filling outside the lock
+    self._claimed = 0
+    self._cond = threading.Condition()
+    ## Sample periods with no sample available
+    self.underruns = 0
+    ## Samples dropped because their deadline had passed
+    self.dropped = 0
+    ## Lowest fill seen since start(), in samples
+    self.min_fill = 0
+
+  @property
+  def size(self):
+    '''!
+      @brief Ring capacity in samples
+    '''
+    return self._size
+
+  @property
+  def fill(self):
+    '''!
+      @brief Samples waiting in the ring
+    '''
+    return self._head - self._tail
+
+  @property
+  def fill_level(self):
+    '''!
+      @brief Fill of the ring between 0.0 and 1.0
+    '''
+    return float(self._head - self._tail) / self._size
+
+  def write(self,samples,timeout=None):
+    '''!
+      @brief Queue samples, blocking while the ring is full and the sink is running
+      @n Before start() or after stop() nothing frees room, so at most size samples can be
+      @n queued; write() then returns at once with the number it queued.
+      @param samples NumPy array, sequence, iterable or generator of samples
+      @param timeout Seconds to wait for room in total, None to wait as long as needed
+      @return Number of samples queued, short if the timeout expired or the sink is not running
+    '''
+    end = None if timeout is None else _now_ns() + int(timeout * 1e9)
+    ring = self._ring
+    ring1 = self._ring1
+    size = self._size
+    cond = self._cond
+    queued = 0
+    for words, words1 in self._dac._word_chunks(samples, self._unit, self._channel):
+      pos = 0
+      n = len(words)
+      while pos < n:
+        with cond:
+          while self._head - self._tail >= size:
+            if self._stop_event.is_set():
+              return queued
+            wait = None if end is None else (end - _now_ns()) / 1e9
+            if wait is not None and wait <= 0:
+              return queued
+            cond.wait(wait)
+          count = min(size - (self._head - self._tail), n - pos)
+          self._claimed = count
+        start = self._head % size
+        _copy_wrapped(ring, start, words, pos, count)
+        if ring1 is not None:
+          _copy_wrapped(ring1, start, words1, pos, count)
+        # Publish the samples only once they are in the ring
+        with cond:
+          self._head += count
+          self._claimed = 0
+        pos += count
+        queued += count
+    return queued
+
+  def drain(self,timeout=None):
+    '''!
+      @brief Wait until every queued sample has been written
+      @param timeout Seconds to wait, None to wait as long as needed
+      @return True if the ring is empty
+    '''
+    with self._cond:
+      return self._cond.wait_for(lambda: self._head == self._tail or not self.is_running(), timeout) and self._head == self._tail
+
+  def clear(self):
+    '''!
+      @brief Drop every queued sample
+    '''
+    with self._cond:
+      self._tail = self._head
+      self._cond.notify_all()
+
+  def _prepare(self):
+    self.underruns = 0
+    self.dropped = 0
+    self.min_fill = self.fill
+    return ()
+
+  def _wake(self):
+    # Writers blocked on a full ring return once the stop event is set
+    with self._cond:
+      self._cond.notify_all()
+
+  def _run(self):
+    dac = self._dac
+    send, dual = dac._bind_writer(self._channel)
+    ring = self._ring
+    ring1 = self._ring1
+    size = self._size
+    cond = self._cond
+    stop = self._stop_event
+    pacer = Pacer(int(1e9 / self.sample_rate), dac.late_policy, dac.spin_ns)
+    send = dac._traced(send, pacer)
+    pacer.start()
+    # An underrun output equal to the last written word is not rewritten
+    last = None
+    repeat = 0
+    try:
+      while not stop.is_set():
+        payload = None
+        with cond:
+          # The slot is read before _tail moves past it, after that the producer may refill it
+          fill = self._head - self._tail
+          if fill:
+            idx = self._tail % size
+            payload = _pair_block(ring[idx],ring1[idx]) if dual else ring[idx]
+            self._tail += 1
+            repeat = 0
+            cond.notify()
+            if fill - 1 < self.min_fill:
+              self.min_fill = fill - 1
+          elif self.underrun == UNDERRUN_REPEAT:
+            # The ring still holds the samples played before, cycle through the newest of
+            # them; the oldest ones may be claimed by write() and half overwritten
+            span = min(self._tail, size - self._claimed)
+            if span > 0:
+              idx = (self._tail - span + repeat % span) % size
+              payload = _pair_block(ring[idx],ring1[idx]) if dual else ring[idx]
+              repeat = (repeat + 1) % span
+        if not fill:
+          self.underruns += 1
+          self.min_fill = 0
+          if self.underrun == UNDERRUN_ZERO:
+            payload = _pair_block(0,0) if dual else 0
+        if payload is not None and (fill or payload != last):
+          send(payload)
+          last = payload
+          self.samples_sent += 1
+        skip = pacer.wait()
+        if skip:
+          # Keep the stream aligned with the clock, samples whose time has passed are dropped
+          with cond:
+            skip = min(skip, self._head - self._tail)
+            self._tail += skip
+            cond.notify()
+          self.dropped += skip
+        self.missed_deadlines = pacer.late
+    finally:
+      with cond:
+        cond.notify_all()
+
+
+def dds_table(shape,amp,offset,dutyCycle=50,voltage=5000,points=DDS_TABLE_POINTS):
+  '''!
+    @brief One period of a waveform as register words, at table resolution
+    @n Amplitude and offset mean the same as for output_sin, output_triangle and output_square.
+    @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+    @param amp Waveform amplitude Vp
+    @param offset Waveform DC offset Voffset
+    @param dutyCycle Duty cycle of triangle and square waves
+    @param voltage Full-scale voltage of the output range in mV
+    @param points Points per period
+    @return List of register words
+  '''
+  k = 4096 / float(voltage)
+  if shape == WAVE_SIN:
+    scale = (amp / float(voltage)) * 2
+    dc = offset * k
+    return [_to_word(int((code - 2047) * scale + dc)) for code in sine_table(points)]
+  dutyCycle = min(max(dutyCycle, 0), 100)
+  up = int(points * dutyCycle / 100.0)
+  maxV = int(amp * k)
+  if shape == WAVE_TRIANGLE:
+    dc = int(offset * k)
+    rise = [_to_word(dc + maxV * i // up) for i in range(up)]
+    fall = [_to_word(dc + maxV * (points - i) // (points - up)) for i in range(up, points)]
+    return rise + fall
+  if shape == WAVE_SQUARE:
+    high = _to_word(int(maxV + offset * k))
+    low = _to_word(int(maxV - offset * k))
+    return [high] * up + [low] * (points - up)
+  raise ValueError("unknown waveform shape: %r" % (shape,))
+
+
+class DDSPlayer(_Playback):
+  '''!
+    @brief Direct digital synthesis: a fixed sample clock steps a 32-bit phase accumulator
+    @n through one high-resolution waveform table. The frequency resolution is
+    @n sample_rate / 2^32, any frequency up to half the sample rate can be played,
+    @n and frequency or waveform changes take effect at the next sample without a phase jump.
+    @n After stop() the output holds the last sample.
+  '''
+  ## Phase accumulator resolution
+  PHASE_BITS = 32
+  _thread_name = "GP8403-dds"
+
+  def __init__(self,dac,channel,sample_rate=None):
+    '''!
+      @param dac DFRobot_GP8403 instance
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @param sample_rate Sample clock in Hz, None for the measured bus rate
+    '''
+    super(DDSPlayer, self).__init__(dac)
+    self._channel = channel
+    if sample_rate is None:
+      sample_rate = dac.sample_rate or dac.measure_sample_rate()
+    self.clock = float(sample_rate)
+    self._table = None
+    self._step = 0
+    # Accumulator at the last stop; while playing it lives in the playback thread
+    self._phase = 0
+    # Phase set by set_phase(), taken over by the playback thread at its next sample
+    self._pending_phase = None
+    self._lock = threading.Lock()
+
+  def set_waveform(self,shape,amp,offset,dutyCycle=50):
+    '''!
+      @brief Select the waveform, may be called while playing
+      @param shape Waveform shape: WAVE_SIN, WAVE_TRIANGLE or WAVE_SQUARE
+      @param amp Waveform amplitude Vp
+      @param offset Waveform DC offset Voffset
+      @param dutyCycle Duty cycle of triangle and square waves
+    '''
+    dac = self._dac
+    buf = dac._calibrated(_make_buffer(dds_table(shape, amp, offset, dutyCycle, dac.voltage), 0), self._channel)
+    dual = self._channel != 0 and self._channel != 1
+    # One reference swap, the playback thread sees the old or the new table, never a mix
+    self._table = buf.blocks if dual else buf.words
+
+  def set_frequency(self,freq):
+    '''!
+      @brief Set the output frequency, may be called while playing; the phase stays continuous
+      @param freq Frequency in Hz, at most half the sample clock
+    '''
+    if freq < 0 or freq > self.clock / 2:
+      raise ValueError("frequency must be between 0 and %.1f Hz" % (self.clock / 2))
+    self._step = int(round(freq / self.clock * (1 << self.PHASE_BITS)))
+
+  @property
+  def frequency(self):
+    '''!
+      @brief Frequency actually played, after quantization of the tuning word
+    '''
+    return self._step * self.clock / (1 << self.PHASE_BITS)
+
+  @property
+  def resolution(self):
+    '''!
+      @brief Frequency resolution in Hz
+    '''
+    return self.clock / (1 << self.PHASE_BITS)
+
+  def set_phase(self,degrees):
+    '''!
+      @brief Jump to a phase, may be called while playing
+      @param degrees Phase in degrees
+    '''
+    with self._lock:
+      self._pending_phase = int((degrees % 360) / 360.0 * (1 << self.PHASE_BITS))
+
+  def _prepare(self):
+    if self._table is None:
+      raise RuntimeError("set_waveform() must be called before start()")
+    return ()
+
+  def _run(self):
+    dac = self._dac
+    send = dac._bind_writer(self._channel)[0]
+    stop = self._stop_event
+    bits = self.PHASE_BITS
+    mask = (1 << bits) - 1
+    pacer = Pacer(int(1e9 / self.clock), dac.late_policy, dac.spin_ns)
+    send = dac._traced(send, pacer)
+    lock = self._lock
+    phase = self._phase
+    self._start_time = _now_ns()
+    pacer.start(self._start_time)
+    try:
+      while not stop.is_set():
+        if self._pending_phase is not None:
+          with lock:
+            phase = self._pending_phase
+            self._pending_phase = None
+        table = self._table
+        send(table[(phase * len(table)) >> bits])
+        self.samples_sent += 1
+        skip = 1 + pacer.wait()
+        # Skipped samples still advance the phase, so the output stays in time
+        phase = (phase + self._step * skip) & mask
+        self.missed_deadlines = pacer.late
+    finally:
+      self._phase = phase
+      self._stop_time = _now_ns()
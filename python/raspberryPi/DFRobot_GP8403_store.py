@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_store.py
+  @brief Backends that play the bit-banged store() sequence of the DAC module.
+  @n The whole sequence is built up front as a list of (scl, sda, delay_us) steps:
+  @n set both lines, then hold for delay_us. A backend submits the list in one go.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import time
+import subprocess
+
+##Pick pigpio, then libgpiod, then the RPi.GPIO implementation
+STORE_AUTO                  =     'auto'
+##pigpio daemon wave, hardware-timed
+STORE_PIGPIO                =     'pigpio'
+##libgpiod 2.x line request, both lines changed in one call per step
+STORE_GPIOD                 =     'gpiod'
+##Original per-edge RPi.GPIO implementation
+STORE_RPI_GPIO              =     'RPi.GPIO'
+
+_now_ns = getattr(time, 'perf_counter_ns', lambda: int(time.time() * 1000000000))
+
+# Command line tools that set a pin function, newest first
+_PIN_TOOLS = ('pinctrl', 'raspi-gpio')
+
+
+def restore_i2c_pins(scl,sda):
+  '''!
+    @brief Give the pins back to the I2C controller (function ALT0) after bit-banging them
+    @n Uses pinctrl (Raspberry Pi OS 12 on) or raspi-gpio, whichever is installed.
+    @param scl BCM number of the SCL pin
+    @param sda BCM number of the SDA pin
+    @exception RuntimeError Neither tool is installed; the pins stay GPIO and the bus is unusable until reboot
+  '''
+  for tool in _PIN_TOOLS:
+    try:
+      for pin in (scl, sda):
+        subprocess.check_call([tool, 'set', str(pin), 'a0'])
+      return
+    except OSError:
+      continue
+  raise RuntimeError("cannot give GPIO%d/GPIO%d back to I2C: install pinctrl or raspi-gpio" % (scl, sda))
+
+
+class _StepBuilder(object):
+  def __init__(self,before,after,total):
+    self.before = before
+    self.after = after
+    self.total = total
+    self.steps = []
+    self.scl = 1
+    self.sda = 1
+
+  def _set(self,scl=None,sda=None,delay=0):
+    if scl is not None:
+      self.scl = scl
+    if sda is not None:
+      self.sda = sda
+    self.steps.append((self.scl, self.sda, delay))
+
+  def start(self):
+    self._set(1, 1, self.before)
+    self._set(sda=0, delay=self.after)
+    self._set(scl=0, delay=self.total)
+
+  def stop(self):
+    self._set(sda=0, delay=self.before)
+    self._set(scl=1, delay=self.total)
+    self._set(sda=1, delay=self.total)
+
+  def byte(self,data,bits=8,flag=True):
+    data &= 0xFF
+    for i in range(bits - 1, -1, -1):
+      self._set(sda=(data >> i) & 1, delay=self.before)
+      self._set(scl=1, delay=self.total)
+      self._set(scl=0, delay=self.after)
+    if flag:
+      # The module pulls SDA low to acknowledge; driving it low too is harmless
+      # and lets backends without input sampling clock the ack slot
+      self._set(sda=0, delay=self.before)
+      self._set(scl=1, delay=self.after + self.before)
+      self._set(scl=0, delay=self.after)
+    else:
+      self._set(sda=0)
+      self._set(scl=1)
+
+  def delay(self,us):
+    self._set(delay=us)
+
+
+def store_steps(addr,before=2,after=3,total=5,delay=1):
+  '''!
+    @brief Build the store sequence
+    @param addr I2C address of the module
+    @param before First half of the bit-bang cycle in us
+    @param after Second half of the bit-bang cycle in us
+    @param total Full bit-bang cycle in us
+    @param delay Pause between the two store phases in us
+    @return List of (scl, sda, delay_us)
+  '''
+  HEAD, ADDR, CMD1, CMD2 = 0x02, 0x10, 0x03, 0x00
+  b = _StepBuilder(before, after, total)
+  b.start()
+  b.byte(HEAD, 3, False)
+  b.stop()
+  b.start()
+  b.byte(ADDR)
+  b.byte(CMD1)
+  b.stop()
+  b.start()
+  b.byte(addr << 1)
+  for i in range(8):
+    b.byte(CMD2)
+  b.stop()
+  b.delay(delay)
+  b.start()
+  b.byte(HEAD, 3, False)
+  b.stop()
+  b.start()
+  b.byte(ADDR)
+  b.byte(CMD2)
+  b.stop()
+  return b.steps
+
+
+class PigpioStore(object):
+  '''!
+    @brief Play the sequence as one pigpio wave, timed by the pigpio daemon's DMA
+    @n The pins are given back to the I2C controller (ALT0) afterwards.
+  '''
+  def __init__(self,scl,sda,pi=None):
+    '''!
+      @param scl BCM number of the SCL pin
+      @param sda BCM number of the SDA pin
+      @param pi Connected pigpio.pi instance, None to connect to the local daemon
+    '''
+    import pigpio
+    self._pigpio = pigpio
+    self.scl = scl
+    self.sda = sda
+    self.pi = pi if pi is not None else pigpio.pi()
+    if not self.pi.connected:
+      raise RuntimeError("pigpio daemon is not running")
+
+  def run(self,steps):
+    pigpio = self._pigpio
+    pi = self.pi
+    scl_bit = 1 << self.scl
+    sda_bit = 1 << self.sda
+    pulses = []
+    for scl, sda, delay in steps:
+      on = (scl_bit if scl else 0) | (sda_bit if sda else 0)
+      off = (scl_bit | sda_bit) & ~on
+      pulses.append(pigpio.pulse(on, off, int(delay)))
+    pi.set_mode(self.scl, pigpio.OUTPUT)
+    pi.set_mode(self.sda, pigpio.OUTPUT)
+    pi.wave_clear()
+    pi.wave_add_generic(pulses)
+    wid = pi.wave_create()
+    try:
+      pi.wave_send_once(wid)
+      while pi.wave_tx_busy():
+        time.sleep(0.001)
+    finally:
+      pi.wave_delete(wid)
+      pi.set_mode(self.scl, pigpio.ALT0)
+      pi.set_mode(self.sda, pigpio.ALT0)
+
+
+class GpiodStore(object):
+  '''!
+    @brief Play the sequence through a libgpiod 2.x line request
+    @n Both lines change in one set_values call per step, holds are busy-waited.
+    @n Releasing the request leaves the pins as GPIO, so they are given back to the
+    @n I2C controller (ALT0) with restore_i2c_pins() afterwards.
+  '''
+  def __init__(self,scl,sda,chip='/dev/gpiochip0'):
+    '''!
+      @param scl Line offset of the SCL pin
+      @param sda Line offset of the SDA pin
+      @param chip GPIO chip device
+    '''
+    import gpiod
+    from gpiod.line import Direction, Value
+    self._gpiod = gpiod
+    self._settings = gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.ACTIVE)
+    self._levels = (Value.INACTIVE, Value.ACTIVE)
+    self.scl = scl
+    self.sda = sda
+    self.chip = chip
+
+  def run(self,steps):
+    levels = self._levels
+    scl_pin = self.scl
+    sda_pin = self.sda
+    request = self._gpiod.request_lines(self.chip, consumer="GP8403-store",
+                                        config={(scl_pin, sda_pin): self._settings})
+    try:
+      set_values = request.set_values
+      for scl, sda, delay in steps:
+        set_values({scl_pin: levels[scl], sda_pin: levels[sda]})
+        end = _now_ns() + delay * 1000
+        while _now_ns() < end:
+          pass
+    finally:
+      request.release()
+      restore_i2c_pins(scl_pin, sda_pin)
+
+
+class SimulatedGPIOStore(object):
+  '''!
+    @brief Record the sequence instead of driving pins, to check the emitted bit pattern
+  '''
+  def __init__(self,scl=3,sda=2):
+    self.scl = scl
+    self.sda = sda
+    ## (time_us, scl, sda) after every step of the last run
+    self.trace = []
+
+  def run(self,steps):
+    t = 0
+    self.trace = []
+    for scl, sda, delay in steps:
+      self.trace.append((t, scl, sda))
+      t += delay
+
+  def frames(self):
+    '''!
+      @brief Decode the recorded trace
+      @return List of frames between START and STOP, each a list of SDA bits sampled on SCL rising edges
+    '''
+    frames = []
+    bits = None
+    sample = None
+    prev_scl, prev_sda = 1, 1
+    for t, scl, sda in self.trace:
+      if scl and prev_scl and prev_sda and not sda:
+        bits = []
+        sample = None
+      elif scl and prev_scl and not prev_sda and sda and bits is not None:
+        frames.append(bits)
+        bits = None
+      elif scl and not prev_scl:
+        sample = sda
+      elif prev_scl and not scl and bits is not None and sample is not None:
+        # A bit only counts once SCL falls; SDA moving while SCL is high is START/STOP
+        bits.append(sample)
+        sample = None
+      prev_scl, prev_sda = scl, sda
+    return frames
+
+
+def open_store_backend(name,scl,sda):
+  '''!
+    @brief Open a store backend by name
+    @param name STORE_AUTO, STORE_PIGPIO, STORE_GPIOD or STORE_RPI_GPIO
+    @param scl SCL pin
+    @param sda SDA pin
+    @return Backend object, or None for the RPi.GPIO implementation of the driver
+  '''
+  if name == STORE_PIGPIO:
+    return PigpioStore(scl, sda)
+  if name == STORE_GPIOD:
+    return GpiodStore(scl, sda)
+  if name == STORE_RPI_GPIO:
+    return None
+  if name == STORE_AUTO:
+    for backend in (PigpioStore, GpiodStore):
+      try:
+        return backend(scl, sda)
+      except (ImportError, RuntimeError, OSError):
+        pass
+    return None
+  raise ValueError("unknown store backend: %r" % (name,))
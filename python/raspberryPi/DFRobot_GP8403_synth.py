@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_synth.py
+  @brief Composite and swept waveforms for the DAC module, synthesized with NumPy.
+  @n Every generator returns the signal in millivolts as one float array, or, with chunk
+  @n set, as a generator of arrays of at most chunk samples for long signals. Samples are
+  @n computed from their absolute time, so chunks join without phase steps.
+  @n quantize() converts a signal to register words once, play() hands it to output_arbitrary.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import math
+import itertools
+
+import numpy as np
+
+from DFRobot_GP8403 import *
+
+##Linear frequency sweep
+SWEEP_LINEAR                =     0
+##Logarithmic (exponential) frequency sweep, equal time per octave
+SWEEP_LOG                   =     1
+
+
+def _render(fn,duration,sample_rate,chunk):
+  if sample_rate <= 0:
+    raise ValueError("sample_rate must be positive")
+  n = int(round(duration * sample_rate))
+  if chunk is None:
+    return fn(np.arange(n) / float(sample_rate))
+  def chunks():
+    for start in range(0, n, chunk):
+      yield fn(np.arange(start, min(start + chunk, n)) / float(sample_rate))
+  return chunks()
+
+
+def tone(freq,amp,offset,duration,sample_rate,phase=0,chunk=None):
+  '''!
+    @brief Sine wave
+    @param freq Frequency in Hz
+    @param amp Amplitude Vp in mV
+    @param offset DC offset in mV
+    @param duration Length in seconds
+    @param sample_rate Sample rate in Hz
+    @param phase Start phase in degrees
+    @param chunk Samples per chunk, None for one array
+  '''
+  ph = math.radians(phase)
+  return _render(lambda t: offset + amp * np.sin(2 * np.pi * freq * t + ph), duration, sample_rate, chunk)
+
+
+def harmonics(fundamental,amps,offset,duration,sample_rate,phases=None,chunk=None):
+  '''!
+    @brief Sum of harmonics of a fundamental
+    @param fundamental Fundamental frequency in Hz
+    @param amps Amplitude Vp in mV of the fundamental, the 2nd harmonic, the 3rd...; 0 skips one
+    @param offset DC offset in mV
+    @param duration Length in seconds
+    @param sample_rate Sample rate in Hz
+    @param phases Phase of every harmonic in degrees, None for all 0
+    @param chunk Samples per chunk, None for one array
+  '''
+  phases = [0] * len(amps) if phases is None else phases
+  terms = [(k + 1, a, math.radians(p)) for k, (a, p) in enumerate(zip(amps, phases)) if a]
+  def fn(t):
+    y = np.full(len(t), float(offset))
+    for k, a, p in terms:
+      y += a * np.sin(2 * np.pi * k * fundamental * t + p)
+    return y
+  return _render(fn, duration, sample_rate, chunk)
+
+
+def chirp(f0,f1,amp,offset,duration,sample_rate,sweep=SWEEP_LINEAR,chunk=None):
+  '''!
+    @brief Sine sweep from f0 to f1
+    @param f0 Start frequency in Hz
+    @param f1 End frequency in Hz
+    @param amp Amplitude Vp in mV
+    @param offset DC offset in mV
+    @param duration Sweep time in seconds
+    @param sample_rate Sample rate in Hz
+    @param sweep SWEEP_LINEAR or SWEEP_LOG
+    @param chunk Samples per chunk, None for one array
+  '''
+  T = float(duration)
+  if sweep == SWEEP_LOG:
+    if f0 <= 0 or f1 <= 0:
+      raise ValueError("a logarithmic sweep needs positive frequencies")
+    if f0 == f1:
+      sweep = SWEEP_LINEAR
+    else:
+      k = math.log(float(f1) / f0) / T
+      phase = lambda t: 2 * np.pi * f0 * np.expm1(k * t) / k
+  if sweep == SWEEP_LINEAR:
+    rate = (f1 - f0) / T
+    phase = lambda t: 2 * np.pi * (f0 * t + rate * t * t / 2)
+  elif sweep != SWEEP_LOG:
+    raise ValueError("unknown sweep: %r" % (sweep,))
+  return _render(lambda t: offset + amp * np.sin(phase(t)), duration, sample_rate, chunk)
+
+
+def am(carrier,modulation,depth,amp,offset,duration,sample_rate,chunk=None):
+  '''!
+    @brief Amplitude-modulated sine, the peak stays at amp
+    @param carrier Carrier frequency in Hz
+    @param modulation Modulating frequency in Hz
+    @param depth Modulation depth between 0 and 1
+    @param amp Peak amplitude in mV
+    @param offset DC offset in mV
+    @param duration Length in seconds
+    @param sample_rate Sample rate in Hz
+    @param chunk Samples per chunk, None for one array
+  '''
+  scale = amp / (1.0 + depth)
+  def fn(t):
+    envelope = 1 + depth * np.sin(2 * np.pi * modulation * t)
+    return offset + scale * envelope * np.sin(2 * np.pi * carrier * t)
+  return _render(fn, duration, sample_rate, chunk)
+
+
+def fm(carrier,modulation,deviation,amp,offset,duration,sample_rate,chunk=None):
+  '''!
+    @brief Frequency-modulated sine
+    @param carrier Carrier frequency in Hz
+    @param modulation Modulating frequency in Hz
+    @param deviation Peak frequency deviation in Hz
+    @param amp Amplitude Vp in mV
+    @param offset DC offset in mV
+    @param duration Length in seconds
+    @param sample_rate Sample rate in Hz
+    @param chunk Samples per chunk, None for one array
+  '''
+  index = float(deviation) / modulation if modulation else 0.0
+  def fn(t):
+    return offset + amp * np.sin(2 * np.pi * carrier * t + index * np.sin(2 * np.pi * modulation * t))
+  return _render(fn, duration, sample_rate, chunk)
+
+
+def quantize(signal,dac,channel=0):
+  '''!
+    @brief Convert a signal to register words for a module, through its calibration if it has one
+    @param signal Array of millivolts, or a generator of such arrays
+    @param dac DFRobot_GP8403 instance, for its output range and calibration
+    @param channel Channel whose calibration is used
+    @return uint16 array of register words, or a generator of them
+  '''
+  tables = dac._cal_tables
+  if tables is not None:
+    lut = np.frombuffer(tables[channel if channel == 1 else 0][0], dtype=np.uint16)
+    top = len(lut) - 1
+    convert = lambda mv: lut[np.clip(mv.astype(np.int64), 0, top)]
+  else:
+    scale = 4095 / float(dac.voltage)
+    convert = lambda mv: (np.clip((mv * scale).astype(np.int64), 0, 4095) << 4).astype(np.uint16)
+  if isinstance(signal, np.ndarray):
+    return convert(signal)
+  return (convert(mv) for mv in signal)
+
+
+def play(dac,signal,sample_rate,channel,loop=False):
+  '''!
+    @brief Output a synthesized signal, converted to register words once
+    @param dac DFRobot_GP8403 instance
+    @param signal Array of millivolts, or a generator of such arrays
+    @param sample_rate Sample rate in Hz the signal was synthesized at
+    @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+    @param loop Repeat an array forever; generators are played once
+  '''
+  if channel != 0 and channel != 1 and dac._cal_tables is not None:
+    # Both channels with their own calibration: one word per sample cannot serve both
+    if not isinstance(signal, np.ndarray):
+      signal = itertools.chain.from_iterable(signal)
+    dac.output_arbitrary(signal, sample_rate, channel, loop, UNIT_MV)
+    return
+  words = quantize(signal, dac, channel)
+  if not isinstance(words, np.ndarray):
+    words = itertools.chain.from_iterable(w.tolist() for w in words)
+  dac.output_arbitrary(words, sample_rate, channel, loop, UNIT_WORD)
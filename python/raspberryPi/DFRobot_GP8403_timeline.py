@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_timeline.py
+  @brief Time-tagged cue engine for the DAC module.
+  @n Events are kept in a heap ordered by time and run on a dedicated thread against
+  @n absolute deadlines of the monotonic clock, so sequence timing does not drift.
+  @n The lateness of every event is recorded.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+from __future__ import print_function
+import json
+import heapq
+import threading
+import itertools
+
+from DFRobot_GP8403 import *
+from DFRobot_GP8403 import _now_ns, _sleep_until, _spin_until
+from DFRobot_GP8403_player import WaveformPlayer
+from DFRobot_GP8403_trace import percentile
+
+##Event: set_DAC_out_voltage(voltage, channel)
+CUE_SET                     =     'set'
+##Event: set_DAC_out_voltage_pair(voltage0, voltage1)
+CUE_PAIR                    =     'pair'
+##Event: ramp_to(voltage, channel, rate=None, duration=None, curve='linear')
+CUE_RAMP                    =     'ramp'
+##Event: start a continuous waveform(channel, shape, amp, freq, offset, dutyCycle=50)
+##A stopped waveform still finishing its period on the channel is cut short
+CUE_WAVE                    =     'wave'
+##Event: stop the waveform of a channel(channel); it ends its current period in the background
+CUE_STOP                    =     'stop'
+##Event: set_DAC_outrange(mode), mode '5V' or '10V' in files
+CUE_RANGE                   =     'range'
+##Event: store()
+CUE_STORE                   =     'store'
+
+_SHAPES = {'sin': WAVE_SIN, 'triangle': WAVE_TRIANGLE, 'square': WAVE_SQUARE}
+_CURVES = {'linear': CURVE_LINEAR, 's': CURVE_S, 'exp': CURVE_EXP}
+_RANGES = {'5V': OUTPUT_RANGE_5V, '10V': OUTPUT_RANGE_10V}
+
+
+def _named(table,value):
+  # Files spell constants by name, code may pass the constants themselves
+  return table.get(value, value) if isinstance(value, str) else value
+
+
+class Timeline(object):
+  '''!
+    @brief Sequence of time-tagged events played on one module
+  '''
+
+  def __init__(self,dac):
+    '''!
+      @param dac DFRobot_GP8403 instance
+    '''
+    self._dac = dac
+    self._heap = []
+    self._seq = itertools.count()
+    self._cond = threading.Condition()
+    self._thread = None
+    self._stop = False
+    self._t0 = 0
+    self._players = {}
+    # Players told to stop and finishing their period, joined by stop()
+    self._stopping = []
+    # channel -> ramp plan started by this timeline, so stop() leaves other ramps alone
+    self._ramps = {}
+    # An event has been taken off the heap and is still running
+    self._busy = False
+    ## (time in s, action, lateness in s once carried out, exception or None) of every event run since start()
+    self.results = []
+
+  def add(self,t,action,**params):
+    '''!
+      @brief Schedule an event, may be called while playing
+      @param t Time in seconds from start()
+      @param action CUE_SET, CUE_PAIR, CUE_RAMP, CUE_WAVE, CUE_STOP, CUE_RANGE, CUE_STORE,
+      @n or a function called with params
+      @param params Arguments of the action, by name
+    '''
+    with self._cond:
+      heapq.heappush(self._heap, (int(t * 1e9), next(self._seq), action, params))
+      self._cond.notify()
+
+  def extend(self,events):
+    '''!
+      @brief Schedule a list of events
+      @param events Dicts with 't', 'action' and the arguments of the action
+    '''
+    for event in events:
+      params = dict(event)
+      self.add(params.pop('t'), params.pop('action'), **params)
+
+  @classmethod
+  def load(cls,dac,path):
+    '''!
+      @brief Build a timeline from a JSON file holding a list of events
+      @n e.g. [{"t": 0.5, "action": "set", "channel": 0, "voltage": 3200},
+      @n {"t": 0.75, "action": "wave", "channel": 1, "shape": "sin", "amp": 1000, "freq": 10, "offset": 2500}]
+      @param dac DFRobot_GP8403 instance
+      @param path File name
+      @return Timeline
+    '''
+    timeline = cls(dac)
+    with open(path) as f:
+      timeline.extend(json.load(f))
+    return timeline
+
+  def __len__(self):
+    return len(self._heap)
+
+  def start(self):
+    '''!
+      @brief Start playing, event times count from now
+    '''
+    if self.is_running():
+      return
+    self._stop = False
+    self.results = []
+    self._t0 = _now_ns()
+    self._thread = threading.Thread(target=self._run, name="GP8403-timeline")
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self,timeout=None):
+    '''!
+      @brief Stop playing; pending events are kept, the waveforms and ramps the timeline started are stopped
+      @param timeout Seconds to wait for the thread, None to wait forever
+    '''
+    with self._cond:
+      self._stop = True
+      self._cond.notify()
+    if self._thread is not None:
+      self._thread.join(timeout)
+      self._thread = None
+    ramper = self._dac._ramper
+    if ramper is not None:
+      for ch, plan in self._ramps.items():
+        ramper.cancel(ch, plan)
+    self._ramps = {}
+    for player in list(self._players.values()) + self._stopping:
+      player.stop(timeout)
+    self._players = {}
+    self._stopping = []
+
+  def wait(self,timeout=None):
+    '''!
+      @brief Wait until every scheduled event has run
+      @param timeout Seconds to wait, None to wait as long as needed
+      @return True if no event is pending
+    '''
+    with self._cond:
+      done = lambda: not self._heap and not self._busy
+      return self._cond.wait_for(lambda: done() or not self.is_running(), timeout) and done()
+
+  def is_running(self):
+    '''!
+      @brief Check whether the timeline thread is running
+    '''
+    return self._thread is not None and self._thread.is_alive()
+
+  def summary(self,percentiles=(50, 90, 99)):
+    '''!
+      @brief Lateness of the events run so far
+      @return dict with 'events', 'errors' and 'lateness_ms' ({percentile: ms} and 'max')
+    '''
+    late = [r[2] * 1000.0 for r in self.results]
+    stats = dict((p, percentile(late, p)) for p in percentiles)
+    stats['max'] = max(late) if late else 0.0
+    return {'events': len(self.results),
+            'errors': sum(1 for r in self.results if r[3] is not None),
+            'lateness_ms': stats}
+
+  def _next_deadline(self):
+    return self._t0 + self._heap[0][0] if self._heap else None
+
+  def _run(self):
+    dac = self._dac
+    cond = self._cond
+    while True:
+      with cond:
+        deadline = _sleep_until(cond, self._next_deadline, dac.spin_ns, lambda: self._stop)
+        if deadline is None:
+          return
+        t, seq, action, params = heapq.heappop(self._heap)
+        self._busy = True
+      _spin_until(deadline)
+      error = None
+      try:
+        self._execute(action, params)
+      except Exception as e:
+        error = e
+      # Counted once the event has been carried out, a slow action shows up as lateness
+      lateness = (_now_ns() - deadline) / 1e9
+      self.results.append((t / 1e9, action, lateness, error))
+      with cond:
+        self._busy = False
+        cond.notify_all()
+
+  def _execute(self,action,params):
+    dac = self._dac
+    if callable(action):
+      action(**params)
+    elif action == CUE_SET:
+      dac.set_DAC_out_voltage(params['voltage'], params['channel'])
+    elif action == CUE_PAIR:
+      dac.set_DAC_out_voltage_pair(params['voltage0'], params['voltage1'])
+    elif action == CUE_RAMP:
+      plans = dac._start_ramp(params['voltage'], params['channel'], params.get('rate'), params.get('duration'),
+                              _named(_CURVES, params.get('curve', CURVE_LINEAR)), None)
+      self._ramps.update(plans)
+    elif action == CUE_WAVE:
+      channel = params['channel']
+      # Joining here would hold every later event until the period ends
+      for stopping in self._stopping:
+        if stopping._channel == channel:
+          stopping._yield_channel()
+      self._stopping = [p for p in self._stopping if p.is_running()]
+      player = self._players.get(channel)
+      if player is None:
+        player = self._players[channel] = WaveformPlayer(dac, channel)
+      player.set_waveform(_named(_SHAPES, params['shape']), params['amp'], params['freq'],
+                          params['offset'], params.get('dutyCycle', 50))
+      player.start()
+    elif action == CUE_STOP:
+      player = self._players.pop(params['channel'], None)
+      if player is not None:
+        # Joining would hold every later event until the period ends
+        player._stop_event.set()
+        self._stopping.append(player)
+    elif action == CUE_RANGE:
+      dac.set_DAC_outrange(_named(_RANGES, params['mode']))
+    elif action == CUE_STORE:
+      dac.store()
+    else:
+      raise ValueError("unknown timeline action: %r" % (action,))
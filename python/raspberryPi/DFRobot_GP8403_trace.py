@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_trace.py
+  @brief Per-sample timing trace of waveform output.
+  @n Every traced bus write records its scheduled time, the time the write started
+  @n and the time it returned, in nanoseconds of the monotonic clock.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import sys
+import time
+import struct
+from array import array
+
+_now_ns = getattr(time, 'perf_counter_ns', lambda: int(time.time() * 1000000000))
+
+##Default number of samples a trace keeps
+TRACE_SIZE                  =     65536
+
+# magic, version, samples in the file, samples recorded in total
+_HEADER = struct.Struct('<8sIIQ')
+_MAGIC = b'GP8403TR'
+_VERSION = 1
+
+
+def percentile(values,p):
+  '''!
+    @brief Linearly interpolated percentile
+    @param values Sequence of numbers
+    @param p Percentile between 0 and 100
+  '''
+  if not values:
+    return 0.0
+  values = sorted(values)
+  k = (len(values) - 1) * p / 100.0
+  lo = int(k)
+  hi = min(lo + 1, len(values) - 1)
+  return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class SampleTrace(object):
+  '''!
+    @brief Timing record of the newest size samples, in preallocated arrays
+  '''
+
+  def __init__(self,size=TRACE_SIZE):
+    '''!
+      @param size Number of samples kept, older ones are overwritten
+    '''
+    if size <= 0:
+      raise ValueError("size must be positive")
+    self.size = size
+    self._scheduled = array('q', [0]) * size
+    self._started = array('q', [0]) * size
+    self._finished = array('q', [0]) * size
+    ## Samples recorded since the last clear(), including overwritten ones
+    self.count = 0
+
+  def __len__(self):
+    return min(self.count, self.size)
+
+  def clear(self):
+    '''!
+      @brief Forget every recorded sample
+    '''
+    self.count = 0
+
+  def wrap(self,send,pacer):
+    '''!
+      @brief Wrap a bus write so every call is recorded
+      @param send Write function
+      @param pacer Pacer whose deadline is the scheduled time of the sample being written
+      @return Traced write function
+    '''
+    scheduled = self._scheduled
+    started = self._started
+    finished = self._finished
+    size = self.size
+    def traced(*args):
+      t0 = _now_ns()
+      send(*args)
+      t1 = _now_ns()
+      i = self.count % size
+      scheduled[i] = pacer.deadline
+      started[i] = t0
+      finished[i] = t1
+      self.count += 1
+    return traced
+
+  def _ordered(self,values):
+    n = len(self)
+    if self.count <= self.size:
+      return values[:n]
+    i = self.count % self.size
+    return values[i:] + values[:i]
+
+  @property
+  def scheduled(self):
+    '''!
+      @brief Scheduled times in ns, oldest first
+    '''
+    return self._ordered(self._scheduled)
+
+  @property
+  def started(self):
+    '''!
+      @brief Write start times in ns, oldest first
+    '''
+    return self._ordered(self._started)
+
+  @property
+  def finished(self):
+    '''!
+      @brief Write return times in ns, oldest first
+    '''
+    return self._ordered(self._finished)
+
+  def lateness(self):
+    '''!
+      @brief Start of every write relative to its scheduled time, in ns
+    '''
+    return [s - d for s, d in zip(self.started, self.scheduled)]
+
+  def write_durations(self):
+    '''!
+      @brief Duration of every bus write, in ns
+    '''
+    return [f - s for s, f in zip(self.started, self.finished)]
+
+  def intervals(self):
+    '''!
+      @brief Time between the starts of consecutive writes, in ns
+    '''
+    started = self.started
+    return [b - a for a, b in zip(started, started[1:])]
+
+  def summary(self,percentiles=(50, 90, 99, 99.9)):
+    '''!
+      @brief Percentiles of lateness and write duration
+      @param percentiles Percentiles to report
+      @return dict with 'samples', 'lateness_us' and 'write_us', both {percentile: us}, and their 'max'
+    '''
+    result = {'samples': len(self)}
+    for name, values in (('lateness_us', self.lateness()), ('write_us', self.write_durations())):
+      stats = dict((p, percentile(values, p) / 1000.0) for p in percentiles)
+      stats['max'] = max(values) / 1000.0 if values else 0.0
+      result[name] = stats
+    return result
+
+  def histogram(self,values,bins=20,lo=None,hi=None):
+    '''!
+      @brief Count values into equal-width bins
+      @param values Sequence of numbers, e.g. lateness() or write_durations()
+      @param bins Number of bins
+      @param lo Lower edge, None for the smallest value
+      @param hi Upper edge, None for the largest value; values outside [lo, hi] go to the end bins
+      @return List of (bin lower edge, count)
+    '''
+    if not values:
+      return []
+    lo = min(values) if lo is None else lo
+    hi = max(values) if hi is None else hi
+    width = float(hi - lo) / bins or 1.0
+    counts = [0] * bins
+    for v in values:
+      counts[min(max(int((v - lo) / width), 0), bins - 1)] += 1
+    return [(lo + i * width, counts[i]) for i in range(bins)]
+
+  def dump(self,path):
+    '''!
+      @brief Write the trace to a binary file
+      @n A 24-byte header (magic 'GP8403TR', version, samples, total recorded, little-endian)
+      @n followed by the scheduled, started and finished arrays as little-endian int64.
+      @param path File name
+    '''
+    with open(path, 'wb') as f:
+      f.write(_HEADER.pack(_MAGIC, _VERSION, len(self), self.count))
+      for values in (self.scheduled, self.started, self.finished):
+        if sys.byteorder != 'little':
+          values = array('q', values)
+          values.byteswap()
+        values.tofile(f)
+
+  @classmethod
+  def load(cls,path):
+    '''!
+      @brief Read a trace written by dump()
+      @param path File name
+      @return SampleTrace
+    '''
+    with open(path, 'rb') as f:
+      magic, version, n, count = _HEADER.unpack(f.read(_HEADER.size))
+      if magic != _MAGIC or version != _VERSION:
+        raise ValueError("not a GP8403 trace file: %s" % path)
+      trace = cls(max(n, 1))
+      for values in (trace._scheduled, trace._started, trace._finished):
+        data = array('q')
+        data.fromfile(f, n)
+        if sys.byteorder != 'little':
+          data.byteswap()
+        values[:n] = data
+    trace.count = n
+    return trace
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_transport.py
+  @brief I2C transports for the DAC module.
+  @n Every transport offers the subset of the smbus.SMBus interface the driver
+  @n uses: read_byte, write_word_data, write_i2c_block_data and close.
+  @n Transports that can queue several writes in one call also offer
+  @n prepare_batch and submit_batch.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import os
+import struct
+import ctypes
+
+# DFRobot_GP8403 star-imports this module, only the transport API is passed on
+__all__ = ['TRANSPORT_AUTO', 'TRANSPORT_SMBUS', 'TRANSPORT_SMBUS2', 'TRANSPORT_DEV', 'TRANSPORT_FAKE',
+           'MAX_BATCH_MESSAGES', 'SMBusTransport', 'DevI2CTransport', 'FakeTransport', 'open_transport']
+
+##Try smbus, then smbus2, then /dev/i2c-N
+TRANSPORT_AUTO              =     'auto'
+##python-smbus
+TRANSPORT_SMBUS             =     'smbus'
+##smbus2
+TRANSPORT_SMBUS2            =     'smbus2'
+##Linux /dev/i2c-N through read/write and ioctl
+TRANSPORT_DEV               =     'dev'
+##In-memory recording fake, no hardware
+TRANSPORT_FAKE              =     'fake'
+##Most messages the kernel accepts in one I2C_RDWR ioctl (I2C_RDWR_IOCTL_MAX_MSGS)
+MAX_BATCH_MESSAGES          =     42
+
+
+class _i2c_msg(ctypes.Structure):
+  _fields_ = [('addr', ctypes.c_uint16),
+              ('flags', ctypes.c_uint16),
+              ('len', ctypes.c_uint16),
+              ('buf', ctypes.POINTER(ctypes.c_uint8))]
+
+
+class _i2c_rdwr_ioctl_data(ctypes.Structure):
+  _fields_ = [('msgs', ctypes.POINTER(_i2c_msg)),
+              ('nmsgs', ctypes.c_uint32)]
+
+
+class SMBusTransport(object):
+  '''!
+    @brief Transport on python-smbus or smbus2
+  '''
+  def __init__(self,bus=1,module='smbus'):
+    '''!
+      @param bus I2C bus number
+      @param module 'smbus' or 'smbus2'
+    '''
+    if module == TRANSPORT_SMBUS2:
+      import smbus2 as smbus
+    else:
+      import smbus
+    self.bus = bus
+    self._bus = smbus.SMBus(bus)
+    self.read_byte = self._bus.read_byte
+    self.write_word_data = self._bus.write_word_data
+    self.write_i2c_block_data = self._bus.write_i2c_block_data
+    if module == TRANSPORT_SMBUS2:
+      self._i2c_msg = smbus.i2c_msg
+      self.prepare_batch = self._prepare_batch
+      self.submit_batch = self._submit_batch
+
+  def _prepare_batch(self,addr,payloads):
+    '''!
+      @brief Build one combined transaction writing every payload (smbus2 only)
+      @param addr I2C address
+      @param payloads Up to MAX_BATCH_MESSAGES byte sequences, each starting with the register
+      @return Opaque batch for submit_batch
+    '''
+    return [self._i2c_msg.write(addr, list(p)) for p in payloads]
+
+  def _submit_batch(self,batch):
+    self._bus.i2c_rdwr(*batch)
+
+  def close(self):
+    self._bus.close()
+
+
+class DevI2CTransport(object):
+  '''!
+    @brief Transport on the Linux i2c-dev interface, without any Python I2C package
+  '''
+  ## ioctl selecting the target address of plain read()/write()
+  I2C_SLAVE = 0x0703
+  ## ioctl running several messages as one combined transaction
+  I2C_RDWR = 0x0707
+
+  def __init__(self,bus=1):
+    '''!
+      @param bus I2C bus number, opens /dev/i2c-<bus>
+    '''
+    import fcntl
+    self._ioctl = fcntl.ioctl
+    self.bus = bus
+    self._fd = os.open('/dev/i2c-%d' % bus, os.O_RDWR)
+    self._addr = None
+
+  def _select(self,addr):
+    if addr != self._addr:
+      self._ioctl(self._fd, self.I2C_SLAVE, addr)
+      self._addr = addr
+
+  def read_byte(self,addr):
+    self._select(addr)
+    return bytearray(os.read(self._fd, 1))[0]
+
+  def write_word_data(self,addr,reg,value):
+    self._select(addr)
+    os.write(self._fd, struct.pack('<BH', reg, value & 0xFFFF))
+
+  def write_i2c_block_data(self,addr,reg,data):
+    self._select(addr)
+    os.write(self._fd, bytes(bytearray([reg]) + bytearray(data)))
+
+  def prepare_batch(self,addr,payloads):
+    '''!
+      @brief Build an I2C_RDWR request writing every payload in one ioctl
+      @param addr I2C address
+      @param payloads Up to MAX_BATCH_MESSAGES byte sequences, each starting with the register
+      @return Opaque batch for submit_batch, may be submitted any number of times
+    '''
+    if len(payloads) > MAX_BATCH_MESSAGES:
+      raise ValueError("at most %d messages per batch" % MAX_BATCH_MESSAGES)
+    data = bytearray()
+    for p in payloads:
+      data.extend(bytearray(p))
+    raw = (ctypes.c_uint8 * len(data)).from_buffer(data)
+    msgs = (_i2c_msg * len(payloads))()
+    pos = 0
+    for i, p in enumerate(payloads):
+      msgs[i].addr = addr
+      msgs[i].flags = 0
+      msgs[i].len = len(p)
+      msgs[i].buf = ctypes.cast(ctypes.byref(raw, pos), ctypes.POINTER(ctypes.c_uint8))
+      pos += len(p)
+    request = _i2c_rdwr_ioctl_data(msgs, len(payloads))
+    # The request only points at msgs and raw, keep them alive with it
+    return (request, msgs, raw, data)
+
+  def submit_batch(self,batch):
+    self._ioctl(self._fd, self.I2C_RDWR, batch[0])
+
+  def close(self):
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+
+
+class FakeTransport(object):
+  '''!
+    @brief In-memory transport that records every transaction, for tests and hosts without I2C
+  '''
+  def __init__(self,bus=1,devices=None):
+    '''!
+      @param bus Bus number, only reported back
+      @param devices Addresses that acknowledge, None for every address
+    '''
+    self.bus = bus
+    self.devices = devices
+    ## (addr, reg, payload bytes) of every write, in order
+    self.log = []
+    ## addr -> {reg: byte}, the register file after all writes
+    self.registers = {}
+
+  def _check(self,addr):
+    if self.devices is not None and addr not in self.devices:
+      raise IOError(121, 'Remote I/O error')
+
+  def _store(self,addr,reg,payload):
+    self._check(addr)
+    self.log.append((addr, reg, tuple(payload)))
+    regs = self.registers.setdefault(addr, {})
+    for i, b in enumerate(payload):
+      regs[reg + i] = b
+
+  def read_byte(self,addr):
+    # Non-zero, which begin() takes as a module being present
+    self._check(addr)
+    return 0xFF
+
+  def write_word_data(self,addr,reg,value):
+    self._store(addr, reg, (value & 0xFF, (value >> 8) & 0xFF))
+
+  def write_i2c_block_data(self,addr,reg,data):
+    self._store(addr, reg, data)
+
+  def prepare_batch(self,addr,payloads):
+    if len(payloads) > MAX_BATCH_MESSAGES:
+      raise ValueError("at most %d messages per batch" % MAX_BATCH_MESSAGES)
+    return [(addr, p[0], tuple(p[1:])) for p in payloads]
+
+  def submit_batch(self,batch):
+    for addr, reg, payload in batch:
+      self._store(addr, reg, payload)
+
+  def word(self,addr,reg):
+    '''!
+      @brief Read back a 16-bit register written earlier
+    '''
+    regs = self.registers.get(addr, {})
+    return regs.get(reg, 0) | (regs.get(reg + 1, 0) << 8)
+
+  def close(self):
+    pass
+
+
+def open_transport(name=TRANSPORT_AUTO,bus=1):
+  '''!
+    @brief Open a transport by name
+    @param name TRANSPORT_AUTO, TRANSPORT_SMBUS, TRANSPORT_SMBUS2, TRANSPORT_DEV or TRANSPORT_FAKE
+    @param bus I2C bus number
+    @return Transport object
+  '''
+  if name == TRANSPORT_AUTO:
+    for module in (TRANSPORT_SMBUS, TRANSPORT_SMBUS2):
+      try:
+        return SMBusTransport(bus, module)
+      except ImportError:
+        pass
+    return DevI2CTransport(bus)
+  if name in (TRANSPORT_SMBUS, TRANSPORT_SMBUS2):
+    return SMBusTransport(bus, name)
+  if name == TRANSPORT_DEV:
+    return DevI2CTransport(bus)
+  if name == TRANSPORT_FAKE:
+    return FakeTransport(bus)
+  raise ValueError("unknown transport: %r" % (name,))
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*
+'''!
+  @file  DFRobot_GP8403_wavefile.py
+  @brief Binary waveform files for long playback profiles.
+  @n A 64-byte header (magic 'GP8403WF', version, sample rate, layout, output channel,
+  @n range in mV, samples, calibration id, little-endian) is followed by the register
+  @n words (code << 4) as little-endian uint16. WaveFile maps the file and plays the words
+  @n straight from the mapping, so a profile of any length starts at once and is read
+  @n page by page as it plays.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-03
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+import sys
+import mmap
+import struct
+from array import array
+
+from DFRobot_GP8403 import *
+from DFRobot_GP8403 import _pair_block
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+##One word per sample, played on the channel recorded in the header
+LAYOUT_MONO                 =     1
+##Interleaved (channel 0, channel 1) words per sample, played on both channels
+LAYOUT_PAIRS                =     2
+
+# magic, version, sample rate, layout, output channel, range in mV, samples, calibration id
+_HEADER = struct.Struct('<8sIdBBHQ32s')
+_MAGIC = b'GP8403WF'
+_VERSION = 1
+
+
+def _calibration_id(dac):
+  return dac.calibration.id if dac.calibration is not None else None
+
+
+class WaveWriter(object):
+  '''!
+    @brief Write a waveform file chunk by chunk, the header is completed by close()
+  '''
+
+  def __init__(self,path,sample_rate,voltage,channel=0,layout=LAYOUT_MONO,calibration_id=None):
+    '''!
+      @param path File name
+      @param sample_rate Sample rate in Hz
+      @param voltage Output range the words were computed for in mV: 5000 or 10000
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @param layout LAYOUT_MONO or LAYOUT_PAIRS; LAYOUT_PAIRS always plays on both channels
+      @param calibration_id Id of the calibration the words were computed with, None if uncalibrated
+    '''
+    if sample_rate <= 0:
+      raise ValueError("sample_rate must be positive")
+    if layout not in (LAYOUT_MONO, LAYOUT_PAIRS):
+      raise ValueError("unknown layout: %r" % (layout,))
+    if calibration_id is not None and len(str(calibration_id).encode('utf-8')) > 32:
+      raise ValueError("calibration id is longer than 32 bytes")
+    self.sample_rate = sample_rate
+    self.voltage = voltage
+    self.channel = channel if layout == LAYOUT_MONO and channel in (0, 1) else 2
+    self.layout = layout
+    self.calibration_id = calibration_id
+    ## Samples written so far; a LAYOUT_PAIRS sample is two words
+    self.samples = 0
+    self._dac = None
+    self._odd = False
+    self._file = open(path, 'wb')
+    self._file.write(self._header())
+
+  @classmethod
+  def for_dac(cls,path,dac,sample_rate,channel):
+    '''!
+      @brief Writer of millivolt samples for a module, converted with its present range and calibration
+      @n Both channels with a calibration get LAYOUT_PAIRS, as each channel needs its own words.
+      @param path File name
+      @param dac DFRobot_GP8403 instance
+      @param sample_rate Sample rate in Hz
+      @param channel Output channel. 0: channel 0; 1: channel 1; 2: all the channels
+      @return WaveWriter, fed with write_mv()
+    '''
+    dual = channel != 0 and channel != 1
+    layout = LAYOUT_PAIRS if dual and dac._cal_tables is not None else LAYOUT_MONO
+    writer = cls(path, sample_rate, dac.voltage, channel, layout, _calibration_id(dac))
+    writer._dac = dac
+    return writer
+
+  def _header(self):
+    cal_id = b'' if self.calibration_id is None else str(self.calibration_id).encode('utf-8')
+    return _HEADER.pack(_MAGIC, _VERSION, float(self.sample_rate), self.layout, self.channel,
+                        self.voltage, self.samples, cal_id)
+
+  def write(self,words):
+    '''!
+      @brief Append register words
+      @param words NumPy array, array('H') or sequence of words; interleaved pairs for LAYOUT_PAIRS
+    '''
+    if np is not None and isinstance(words, np.ndarray):
+      data = words.astype('<u2')
+    else:
+      data = array('H', words)
+      if sys.byteorder != 'little':
+        data.byteswap()
+    n = len(data)
+    if self.layout == LAYOUT_PAIRS:
+      # A pair may be split across calls
+      self.samples += (n + self._odd) // 2
+      self._odd = (n + self._odd) % 2 == 1
+    else:
+      self.samples += n
+    self._file.write(data.tobytes())
+
+  def write_mv(self,samples):
+    '''!
+      @brief Append millivolt samples, only for writers made by for_dac()
+      @param samples NumPy array, sequence, iterable or generator of millivolts
+    '''
+    if self._dac is None:
+      raise RuntimeError("write_mv() needs a writer made by for_dac()")
+    for words, words1 in self._dac._word_chunks(samples, UNIT_MV, self.channel):
+      if self.layout == LAYOUT_PAIRS:
+        pairs = array('H', words) * 2
+        pairs[0::2] = array('H', words)
+        pairs[1::2] = array('H', words1)
+        words = pairs
+      self.write(words)
+
+  def close(self):
+    '''!
+      @brief Complete the header and close the file
+    '''
+    if self._file is None:
+      return
+    if self._odd:
+      raise ValueError("LAYOUT_PAIRS file ends with half a pair")
+    self._file.seek(0)
+    self._file.write(self._header())
+    self._file.close()
+    self._file = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,*exc):
+    self.close()
+
+
+class WaveFile(object):
+  '''!
+    @brief Waveform file mapped into memory
+  '''
+
+  def __init__(self,path):
+    '''!
+      @param path File name
+    '''
+    self._file = open(path, 'rb')
+    try:
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      # Files shorter than the header cannot be mapped
+      self._file.close()
+      raise ValueError("not a GP8403 waveform file: %s" % path)
+    if len(self._map) < _HEADER.size:
+      self.close()
+      raise ValueError("not a GP8403 waveform file: %s" % path)
+    (magic, version, self.sample_rate, self.layout, self.channel, self.voltage,
+     self.samples, cal_id) = _HEADER.unpack(self._map[:_HEADER.size])
+    if magic != _MAGIC or version != _VERSION:
+      self.close()
+      raise ValueError("not a GP8403 waveform file: %s" % path)
+    cal_id = cal_id.rstrip(b'\0')
+    self.calibration_id = cal_id.decode('utf-8') if cal_id else None
+    end = _HEADER.size + self.samples * self.layout * 2
+    if len(self._map) < end:
+      self.close()
+      raise ValueError("truncated GP8403 waveform file: %s" % path)
+    self._view = memoryview(self._map)[_HEADER.size:end]
+    if sys.byteorder == 'little':
+      ## Register words as memoryview of uint16 over the mapping; interleaved pairs for LAYOUT_PAIRS
+      self.words = self._view.cast('H')
+    else:
+      # Big-endian hosts get a byte-swapped copy
+      self.words = array('H', self._view.tobytes())
+      self.words.byteswap()
+
+  def __len__(self):
+    return self.samples
+
+  @property
+  def duration(self):
+    '''!
+      @brief Playing time in seconds
+    '''
+    return self.samples / self.sample_rate
+
+  def close(self):
+    '''!
+      @brief Release the mapping; words must not be used afterwards
+    '''
+    for name in ('words', '_view'):
+      view = getattr(self, name, None)
+      if isinstance(view, memoryview):
+        view.release()
+    if getattr(self, '_map', None) is not None:
+      self._map.close()
+      self._map = None
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self,*exc):
+    self.close()
+
+  def play(self,dac,loop=False,channel=None):
+    '''!
+      @brief Output the file, words are sent from the mapping in chunks without conversion
+      @param dac DFRobot_GP8403 instance, in the range and with the calibration the file was written for
+      @param loop Repeat the file forever
+      @param channel Output channel of a LAYOUT_MONO file, None for the one in the header
+    '''
+    if dac.voltage != self.voltage:
+      raise ValueError("file is for the %dmV range, the module is in the %dmV range" % (self.voltage, dac.voltage))
+    if _calibration_id(dac) != self.calibration_id:
+      raise ValueError("file is for calibration %r, the module has %r" % (self.calibration_id, _calibration_id(dac)))
+    if self.layout == LAYOUT_MONO:
+      dac.output_arbitrary(self.words, self.sample_rate, self.channel if channel is None else channel, loop, UNIT_WORD)
+      return
+    words = self.words
+    size = ARBITRARY_CHUNK_SIZE * 2
+    def chunks():
+      for start in range(0, len(words), size):
+        chunk = words[start:start + size].tolist()
+        yield [_pair_block(w0,w1) for w0, w1 in zip(chunk[0::2], chunk[1::2])]
+    send = dac._bind_writer(2)[0]
+    dac._stream_payloads(chunks, send, self.sample_rate, loop)
@@ -0,0 +1,216 @@
+# -*- coding:utf-8 -*-
+'''!
+  @file  benchmark.py
+  @brief  Measure bus throughput, per-sample overhead, jitter and frequency error of the DAC driver.
+  @n Runs offline against a simulated SMBus transport that models per-transaction latency,
+  @n or against the real bus with --hardware.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-07
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+from __future__ import print_function
+import sys
+import os
+import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from DFRobot_GP8403 import *
+from DFRobot_GP8403 import _now_ns, _spin_until
+from DFRobot_GP8403_trace import percentile
+
+
+class SimulatedSMBus(object):
+  '''!
+    @brief Transport that blocks for the time a transaction takes on the wire
+  '''
+  def __init__(self,bus=1,clock=100000,overhead_ns=60000):
+    '''!
+      @param bus Bus number, ignored
+      @param clock Simulated I2C clock in Hz
+      @param overhead_ns Fixed cost of one transaction (syscall, driver, start/stop) in ns
+    '''
+    self.clock = clock
+    self.overhead_ns = overhead_ns
+    self.timestamps = []
+
+  def _transfer(self,nbytes):
+    # Address byte plus payload, 9 clocks per byte
+    end = _now_ns() + self.overhead_ns + (nbytes + 1) * 9 * 1000000000 // self.clock
+    self.timestamps.append(_now_ns())
+    _spin_until(end)
+
+  def read_byte(self,addr):
+    self._transfer(1)
+    return 0
+
+  def write_word_data(self,addr,reg,value):
+    self._transfer(3)
+
+  def write_i2c_block_data(self,addr,reg,data):
+    self._transfer(1 + len(data))
+
+
+class TimedBus(object):
+  '''!
+    @brief Wrap a real bus and record the time of every transaction
+  '''
+  def __init__(self,bus):
+    self._bus = bus
+    self.timestamps = []
+
+  def read_byte(self,addr):
+    self.timestamps.append(_now_ns())
+    return self._bus.read_byte(addr)
+
+  def write_word_data(self,addr,reg,value):
+    self.timestamps.append(_now_ns())
+    self._bus.write_word_data(addr,reg,value)
+
+  def write_i2c_block_data(self,addr,reg,data):
+    self.timestamps.append(_now_ns())
+    self._bus.write_i2c_block_data(addr,reg,data)
+
+
+def bench_setpoint(dac,count):
+  '''!
+    @brief Sustained set_DAC_out_voltage rate and the Python time spent per call
+  '''
+  bus = dac.i2c
+  latency = bus.overhead_ns, bus.clock
+  start = _now_ns()
+  for i in range(count):
+    dac.set_DAC_out_voltage(i % 5000, 0)
+  elapsed = _now_ns() - start
+  # Python overhead alone: the same loop with a zero-latency bus
+  bus.overhead_ns, bus.clock = 0, 10 ** 15
+  start = _now_ns()
+  for i in range(count):
+    dac.set_DAC_out_voltage(i % 5000, 0)
+  overhead = _now_ns() - start
+  bus.overhead_ns, bus.clock = latency
+  del bus.timestamps[:]
+  return {
+    'name': 'set_DAC_out_voltage',
+    'samples_per_s': count * 1e9 / elapsed,
+    'overhead_us': overhead / 1000.0 / count,
+  }
+
+
+def waveform_overhead(dac,buf,channel,periods):
+  '''!
+    @brief Python time per sample of the waveform loop, on a zero-latency bus with a 1ns frame so nothing waits
+  '''
+  bus = dac.i2c
+  latency = bus.overhead_ns, bus.clock
+  policy = dac.late_policy
+  bus.overhead_ns, bus.clock = 0, 10 ** 15
+  # Late samples go out back to back instead of being skipped, so every sample is timed
+  dac.set_pacing(LATE_CATCH_UP, dac.spin_ns)
+  fast = buf._replace(frame_ns=1)
+  del bus.timestamps[:]
+  start = _now_ns()
+  for i in range(periods):
+    dac.output_buffer(fast, channel)
+  elapsed = _now_ns() - start
+  samples = len(bus.timestamps)
+  dac.set_pacing(policy, dac.spin_ns)
+  bus.overhead_ns, bus.clock = latency
+  del bus.timestamps[:]
+  return elapsed / 1000.0 / samples
+
+
+def bench_waveform(dac,name,shape,freq,channel,periods):
+  '''!
+    @brief Run whole periods of one waveform and compare the result with the request
+  '''
+  bus = dac.i2c
+  buf = dac.waveform(shape, 2000, freq, 2500, 50)
+  output = getattr(dac, 'output_' + name)
+  if name == 'sin':
+    method = lambda: output(2000, freq, 2500, channel)
+  else:
+    method = lambda: output(2000, freq, 2500, 50, channel)
+  del bus.timestamps[:]
+  start = _now_ns()
+  for i in range(periods):
+    method()
+  elapsed = _now_ns() - start
+  stamps = bus.timestamps
+  intervals = [b - a for a, b in zip(stamps, stamps[1:])]
+  jitter = [abs(t - buf.frame_ns) / 1000.0 for t in intervals]
+  achieved = periods * 1e9 / elapsed
+  result = {
+    'name': '%s %gHz ch%d' % (name, freq, channel),
+    'samples_per_s': len(stamps) * 1e9 / elapsed,
+    'samples': len(stamps),
+    'jitter_p50_us': percentile(jitter, 50),
+    'jitter_p99_us': percentile(jitter, 99),
+    'jitter_max_us': max(jitter) if jitter else 0.0,
+    'freq_error_pct': (achieved - freq) * 100.0 / freq,
+  }
+  if isinstance(bus, SimulatedSMBus):
+    result['overhead_us'] = waveform_overhead(dac, buf, channel, periods)
+  return result
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--hardware', action='store_true', help='use the real bus instead of the simulation')
+  parser.add_argument('--addr', type=lambda v: int(v, 0), default=0x58, help='I2C address')
+  parser.add_argument('--clock', type=int, default=100000, help='simulated I2C clock in Hz')
+  parser.add_argument('--overhead-us', type=float, default=60.0, help='simulated fixed cost per transaction in us')
+  parser.add_argument('--count', type=int, default=2000, help='set_DAC_out_voltage calls')
+  parser.add_argument('--periods', type=int, default=3, help='waveform periods per combination')
+  parser.add_argument('--freq', type=float, action='append', help='waveform frequencies, repeatable')
+  parser.add_argument('--json', help='also write the results to this file')
+  parser.add_argument('--max-overhead-us', type=float, help='fail if any per-sample Python overhead exceeds this')
+  parser.add_argument('--max-freq-error-pct', type=float, help='fail if any waveform frequency error exceeds this')
+  args = parser.parse_args(argv)
+
+  if args.hardware:
+    dac = DFRobot_GP8403(args.addr)
+    dac.i2c = TimedBus(dac.i2c)
+  else:
+    dac = DFRobot_GP8403(args.addr, transport=SimulatedSMBus(1, args.clock, int(args.overhead_us * 1000)))
+  dac.set_DAC_outrange(OUTPUT_RANGE_5V)
+  print("measured bus rate: %.0f samples/s" % dac.measure_sample_rate(64))
+
+  results = []
+  if not args.hardware:
+    results.append(bench_setpoint(dac, args.count))
+  shapes = (('sin', WAVE_SIN), ('triangle', WAVE_TRIANGLE), ('square', WAVE_SQUARE))
+  for name, shape in shapes:
+    for freq in args.freq or [1, 10, 40]:
+      for channel in (0, 1, 2):
+        results.append(bench_waveform(dac, name, shape, freq, channel, args.periods))
+
+  print("%-24s %12s %12s %10s %10s %10s %10s" % ('case', 'samples/s', 'overhead us', 'p50 us', 'p99 us', 'max us', 'freq err%'))
+  for r in results:
+    print("%-24s %12.0f %12s %10s %10s %10s %10s" % (
+      r['name'], r['samples_per_s'],
+      '%.1f' % r['overhead_us'] if 'overhead_us' in r else '-',
+      '%.1f' % r['jitter_p50_us'] if 'jitter_p50_us' in r else '-',
+      '%.1f' % r['jitter_p99_us'] if 'jitter_p99_us' in r else '-',
+      '%.1f' % r['jitter_max_us'] if 'jitter_max_us' in r else '-',
+      '%+.2f' % r['freq_error_pct'] if 'freq_error_pct' in r else '-'))
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(results, f, indent=2)
+
+  failed = False
+  for r in results:
+    if args.max_overhead_us is not None and r.get('overhead_us', 0) > args.max_overhead_us:
+      print("FAIL %s: overhead %.1fus > %.1fus" % (r['name'], r['overhead_us'], args.max_overhead_us))
+      failed = True
+    if args.max_freq_error_pct is not None and abs(r.get('freq_error_pct', 0)) > args.max_freq_error_pct:
+      print("FAIL %s: frequency error %.2f%% > %.2f%%" % (r['name'], r['freq_error_pct'], args.max_freq_error_pct))
+      failed = True
+  return 1 if failed else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,40 @@
+# -*- coding:utf-8 -*-
+'''!
+  @file  output_player.py
+  @brief  Play a sine wave in the background and retune it while the main loop keeps running.
+  @copyright  Copyright (c) 2010 DFRobot Co.Ltd (http://www.dfrobot.com)
+  @license  The MIT License (MIT)
+  @author  [tangjie](jie.tang@dfrobot.com)
+  @version  V1.0
+  @date  2022-03-07
+  @url  https://github.com/DFRobot/DFRobot_GP8403
+'''
+from __future__ import print_function
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from DFRobot_GP8403 import *
+from DFRobot_GP8403_player import WaveformPlayer
+
+DAC = DFRobot_GP8403(0x58)  
+while DAC.begin() != 0:
+    print("init error")
+    time.sleep(1)
+print("init succeed")
+  
+#Set output range  
+DAC.set_DAC_outrange(OUTPUT_RANGE_5V)
+
+player = WaveformPlayer(DAC, 0)
+player.set_waveform(WAVE_SIN, 2500, 10, 2500)
+player.start()
+try:
+  while True:
+    for freq in (5, 10, 20):
+      time.sleep(2)
+      player.retune(freq=freq)
+      print("rate: %.1f samples/s, missed deadlines: %d" % (player.sample_rate, player.missed_deadlines))
+finally:
+  player.stop()
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def dac():
+  # Module on the in-memory fake bus
+  from DFRobot_GP8403 import DFRobot_GP8403, TRANSPORT_FAKE
+  return DFRobot_GP8403(0x58, transport=TRANSPORT_FAKE)
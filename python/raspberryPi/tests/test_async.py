@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*
+import asyncio
+
+from DFRobot_GP8403 import *
+from DFRobot_GP8403_async import AsyncGP8403
+
+
+def test_concurrent_plays_all_run(dac):
+  adac = AsyncGP8403(dac)
+  reg = DFRobot_GP8403.GP8403_CONFIG_CURRENT_REG
+  async def main():
+    tasks = [adac.play(WAVE_SIN, 1000, 50, 2500, channel) for channel in (0, 1, 2)]
+    await asyncio.sleep(0.2)
+    start = len(dac.i2c.log)
+    await asyncio.sleep(0.1)
+    written = set((r, len(p)) for a, r, p in dac.i2c.log[start:])
+    for task in tasks:
+      task.cancel()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return written, results
+  written, results = asyncio.run(main())
+  assert written == set([(reg, 2), (reg << 1, 2), (reg, 4)])
+  assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+def test_writer_is_bound_under_bus_lock(dac):
+  adac = AsyncGP8403(dac)
+  held = []
+  bind = dac._sample_writer
+  def sample_writer(buf, channel):
+    held.append(adac._lock.locked())
+    return bind(buf, channel)
+  dac._sample_writer = sample_writer
+  asyncio.run(adac.output_sin(1000, 100, 2500, 0))
+  assert held == [True]
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*
+import math
+import time
+import threading
+
+from DFRobot_GP8403 import *
+
+
+def test_output_arbitrary_returns_on_no_samples(dac):
+  done = []
+  thread = threading.Thread(target=lambda: done.append(dac.output_arbitrary([], 1000, 0)))
+  thread.daemon = True
+  thread.start()
+  thread.join(2.0)
+  assert done == [None]
+
+
+def test_setpoint_lands_after_a_ramp_step_being_written(dac):
+  dac.sample_rate = 1000
+  dac.set_DAC_out_voltage(0, 0)
+  in_step = threading.Event()
+  send = dac._send_data
+  def send_data(data, channel):
+    if threading.current_thread().name == "GP8403-ramp" and not in_step.is_set():
+      # Hold the first ramp step on the bus while the setpoint comes in
+      in_step.set()
+      time.sleep(0.1)
+    send(data, channel)
+  dac._send_data = send_data
+  dac.ramp_to(5000, 0, duration=10)
+  assert in_step.wait(2.0)
+  dac.set_DAC_out_voltage(2500, 0)
+  time.sleep(0.2)
+  assert not dac.is_ramping(0)
+  assert dac.i2c.word(0x58, DFRobot_GP8403.GP8403_CONFIG_CURRENT_REG) == dac._setpoint_words(2500)[0]
+
+
+def _curve(curve, u):
+  if curve == CURVE_LINEAR:
+    return u
+  if curve == CURVE_S:
+    return u * u * (3 - 2 * u)
+  return (1 - math.exp(-5 * u)) / (1 - math.exp(-5))
+
+
+def test_ramp_steps_follow_the_curve_on_the_frame_grid(dac):
+  word_of = lambda mv: dac._setpoint_words(mv)[0]
+  frame = 1000000
+  for curve in (CURVE_LINEAR, CURVE_S, CURVE_EXP):
+    for begin, end in ((500, 4500), (4000, 1000)):
+      steps = ramp_steps(begin, end, 2000 * frame, frame, curve, word_of)
+      assert steps[-1] == (2000 * frame, end, word_of(end))
+      assert all(t % frame == 0 for t, mv, word in steps)
+      assert all(a[0] < b[0] for a, b in zip(steps, steps[1:]))
+      # At every frame the output is within a code of the curve sampled there
+      i = 0
+      word = word_of(begin)
+      for f in range(1, 2001):
+        while i < len(steps) and steps[i][0] <= f * frame:
+          word = steps[i][2]
+          i += 1
+        assert abs(word - word_of(begin + (end - begin) * _curve(curve, f / 2000.0))) <= 16
+
+
+def test_long_ramp_costs_codes_not_frames():
+  word_of = lambda mv: int(mv * 4095 // 5000) << 4
+  began = time.perf_counter()
+  steps = ramp_steps(0, 5000, 3600 * 10 ** 9, 500000, CURVE_S, word_of)
+  assert time.perf_counter() - began < 1.0
+  assert len(steps) == 4095
+  assert steps[-1] == (3600 * 10 ** 9, 5000, 4095 << 4)
+
+
+def test_ramp_to_reaches_target_on_fake_bus(dac):
+  dac.set_DAC_out_voltage(1000, CHANNELALL)
+  dac.ramp_to(4000, CHANNELALL, duration=0.2, curve=CURVE_S)
+  assert dac.is_ramping()
+  assert dac.wait_ramp(timeout=2.0)
+  reg = DFRobot_GP8403.GP8403_CONFIG_CURRENT_REG
+  assert dac.i2c.word(0x58, reg) == dac._setpoint_words(4000)[0]
+  assert dac.i2c.word(0x58, reg << 1) == dac._setpoint_words(4000)[1]
+  assert dac._setpoints == [4000, 4000]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*
+import sys
+import time
+import threading
+
+import DFRobot_GP8403_player as player_module
+from DFRobot_GP8403 import *
+from DFRobot_GP8403_player import StreamSink, DDSPlayer, WaveformPlayer, UNDERRUN_REPEAT, dds_table
+
+
+def _words(dac, start, reg):
+  return [lo | (hi << 8) for addr, r, (lo, hi) in dac.i2c.log[start:] if r == reg]
+
+
+def test_stream_sink_keeps_order_through_small_ring(dac):
+  start = len(dac.i2c.log)
+  ramp = [(i % 4096) << 4 for i in range(4000)]
+  sink = StreamSink(dac, 0, 20000, size=8, unit=UNIT_WORD)
+  # Switch threads often so the producer refills slots as soon as the consumer frees them
+  interval = sys.getswitchinterval()
+  sys.setswitchinterval(1e-6)
+  try:
+    sink.start()
+    assert sink.write(ramp, timeout=10) == len(ramp)
+    assert sink.drain(10)
+    sink.stop()
+  finally:
+    sys.setswitchinterval(interval)
+  sent = _words(dac, start, DFRobot_GP8403.GP8403_CONFIG_CURRENT_REG)
+  assert sent
+  assert all(a < b for a, b in zip(sent, sent[1:]))
+
+
+def test_dds_player_set_phase_while_running(dac):
+  table = dds_table(WAVE_SIN, 1000, 2500, voltage=dac.voltage)
+  player = DDSPlayer(dac, 0, sample_rate=2000)
+  player.set_waveform(WAVE_SIN, 1000, 2500)
+  player.set_frequency(0)
+  player.start()
+  try:
+    time.sleep(0.05)
+    player.set_phase(90)
+    time.sleep(0.05)
+  finally:
+    player.stop()
+  assert dac.i2c.word(0x58, DFRobot_GP8403.GP8403_CONFIG_CURRENT_REG) == table[len(table) // 4]
+  assert player._phase == 1 << (DDSPlayer.PHASE_BITS - 2)
+
+
+def test_waveform_player_binds_writer_once(dac):
+  forgets = []
+  forget = dac._forget_streamed
+  dac._forget_streamed = lambda channel: (forgets.append(channel), forget(channel))
+  player = WaveformPlayer(dac, 0)
+  player.set_waveform(WAVE_SIN, 1000, 200, 2500)
+  player.start()
+  try:
+    time.sleep(0.1)
+    player.retune(amp=500)
+    time.sleep(0.05)
+  finally:
+    player.stop()
+  assert player.periods > 2
+  assert forgets == [0]
+
+
+def _write_in_thread(sink, samples):
+  # The write must return on its own; a join timeout keeps a regression from hanging the run
+  queued = []
+  thread = threading.Thread(target=lambda: queued.append(sink.write(samples)))
+  thread.daemon = True
+  thread.start()
+  thread.join(2.0)
+  return queued[0] if queued else None
+
+
+def test_stream_sink_write_returns_when_not_running(dac):
+  sink = StreamSink(dac, 0, 1000, size=8, unit=UNIT_WORD)
+  # More than the ring holds before start()
+  assert _write_in_thread(sink, [16] * 20) == 8
+  sink.start()
+  sink.stop()
+  sink.clear()
+  assert _write_in_thread(sink, [16] * 20) == 8
+
+
+def test_stream_sink_repeat_skips_slots_being_refilled(dac, monkeypatch):
+  reg = DFRobot_GP8403.GP8403_CONFIG_CURRENT_REG
+  # No sample may be skipped for lateness, every new one must be heard
+  dac.set_pacing(LATE_CATCH_UP)
+  sink = StreamSink(dac, 0, 2000, size=8, underrun=UNDERRUN_REPEAT, unit=UNIT_WORD)
+  old = [(i + 1) << 4 for i in range(8)]
+  new = [(i + 100) << 4 for i in range(4)]
+  sink.start()
+  try:
+    assert sink.write(old) == 8
+    assert sink.drain(2.0)
+    # Let the consumer cycle through the played samples, then refill slowly
+    time.sleep(0.02)
+    copy = player_module._copy_wrapped
+    published = []
+    def slow_copy(ring, start, words, pos, count):
+      copy(ring, start, words, pos, count)
+      time.sleep(0.05)
+      published.append(len(dac.i2c.log))
+    monkeypatch.setattr(player_module, '_copy_wrapped', slow_copy)
+    assert sink.write(new) == 4
+    assert sink.drain(2.0)
+  finally:
+    sink.stop()
+  before = [lo | (hi << 8) for addr, r, (lo, hi) in dac.i2c.log[:published[0]] if r == reg]
+  assert set(before) <= set(old)
+  assert set(new) <= set(_words(dac, published[0], reg))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*
+import sys
+import types
+
+import DFRobot_GP8403 as driver
+import DFRobot_GP8403_store
+from DFRobot_GP8403 import *
+from DFRobot_GP8403_store import GpiodStore, restore_i2c_pins
+
+
+def _fake_gpiod(log):
+  line = types.ModuleType('gpiod.line')
+  line.Direction = types.SimpleNamespace(OUTPUT='out')
+  line.Value = types.SimpleNamespace(INACTIVE=0, ACTIVE=1)
+  class Request(object):
+    def set_values(self, values):
+      log.append(('set', values))
+    def release(self):
+      log.append(('release',))
+  gpiod = types.ModuleType('gpiod')
+  gpiod.line = line
+  gpiod.LineSettings = lambda **kwargs: kwargs
+  gpiod.request_lines = lambda chip, consumer, config: Request()
+  return gpiod, line
+
+
+class _FakeGPIO(object):
+  BCM = 'bcm'
+  OUT = 'out'
+  IN = 'in'
+  HIGH = 1
+  LOW = 0
+  def setmode(self, mode):
+    pass
+  def setwarnings(self, flag):
+    pass
+  def setup(self, pin, mode):
+    pass
+  def output(self, pin, level):
+    pass
+  def input(self, pin):
+    return 0
+
+
+def test_gpiod_backend_gives_pins_back_to_i2c(monkeypatch):
+  log = []
+  gpiod, line = _fake_gpiod(log)
+  monkeypatch.setitem(sys.modules, 'gpiod', gpiod)
+  monkeypatch.setitem(sys.modules, 'gpiod.line', line)
+  monkeypatch.setattr(DFRobot_GP8403_store, 'restore_i2c_pins', lambda scl, sda: log.append(('alt0', scl, sda)))
+  GpiodStore(3, 2).run(DFRobot_GP8403_store.store_steps(0x58, 0, 0, 0, 0))
+  assert log[-2:] == [('release',), ('alt0', 3, 2)]
+
+
+def test_rpi_gpio_fallback_gives_pins_back_to_i2c(dac, monkeypatch):
+  restored = []
+  monkeypatch.setattr(driver, 'GPIO', _FakeGPIO())
+  monkeypatch.setattr(driver, 'restore_i2c_pins', lambda scl, sda: restored.append((scl, sda)))
+  dac.set_store_backend(STORE_RPI_GPIO)
+  dac.store()
+  assert restored == [(3, 2)]
+  assert not dac._gpio_ready
+
+
+def test_restore_i2c_pins_falls_back_to_raspi_gpio(monkeypatch):
+  calls = []
+  def check_call(args):
+    if args[0] == 'pinctrl':
+      raise OSError(2, 'No such file or directory')
+    calls.append(args)
+  monkeypatch.setattr(DFRobot_GP8403_store.subprocess, 'check_call', check_call)
+  restore_i2c_pins(3, 2)
+  assert calls == [['raspi-gpio', 'set', '3', 'a0'], ['raspi-gpio', 'set', '2', 'a0']]
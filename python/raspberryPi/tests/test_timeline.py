@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*
+import time
+
+from DFRobot_GP8403 import *
+from DFRobot_GP8403_timeline import *
+
+
+def test_stop_cue_does_not_delay_later_cues(dac):
+  timeline = Timeline(dac)
+  timeline.add(0.0, CUE_WAVE, channel=0, shape='sin', amp=1000, freq=2, offset=2500)
+  timeline.add(0.1, CUE_STOP, channel=0)
+  timeline.add(0.2, CUE_SET, channel=1, voltage=3000)
+  timeline.start()
+  try:
+    assert timeline.wait(1.0)
+  finally:
+    timeline.stop()
+  assert [r[3] for r in timeline.results] == [None, None, None]
+  assert timeline.results[-1][2] < 0.05
+
+
+def test_stop_leaves_other_ramps_running(dac):
+  dac.set_DAC_out_voltage(0, CHANNELALL)
+  dac.ramp_to(4000, 1, duration=5)
+  timeline = Timeline(dac)
+  timeline.add(0.0, CUE_RAMP, channel=0, voltage=4000, duration=5)
+  timeline.start()
+  assert timeline.wait(1.0)
+  assert dac.is_ramping(0)
+  timeline.stop()
+  assert not dac.is_ramping(0)
+  assert dac.is_ramping(1)
+  dac.stop_ramp()
+
+
+def test_wait_returns_after_last_event_ran(dac):
+  done = []
+  def slow():
+    time.sleep(0.2)
+    done.append(True)
+  timeline = Timeline(dac)
+  timeline.add(0.0, slow)
+  timeline.start()
+  time.sleep(0.05)
+  try:
+    assert timeline.wait(2.0)
+    assert done
+  finally:
+    timeline.stop()
+
+
+def test_wave_after_stop_does_not_delay_later_cues(dac):
+  timeline = Timeline(dac)
+  timeline.add(0.0, CUE_WAVE, channel=0, shape='sin', amp=1000, freq=1, offset=2500)
+  timeline.add(0.1, CUE_STOP, channel=0)
+  timeline.add(0.2, CUE_WAVE, channel=0, shape='sin', amp=500, freq=1, offset=2500)
+  timeline.add(0.3, CUE_SET, channel=1, voltage=3000)
+  timeline.start()
+  try:
+    assert timeline.wait(1.0)
+    assert all(r[2] < 0.05 for r in timeline.results)
+    assert [r[3] for r in timeline.results] == [None] * 4
+    stopped = timeline._stopping
+  finally:
+    timeline.stop()
+  assert not any(p.is_running() for p in stopped)